@@ -0,0 +1,37 @@
+"""
+Production serving profile for gunicorn (picked up automatically from the
+working directory, and passed explicitly in the Procfile).
+
+The app is preloaded in the master so Django, the templates and the URL
+patterns are loaded once and shared with every worker. Each worker then
+opens its own database connection before it accepts the first request;
+CONN_MAX_AGE in settings keeps that connection for the requests that follow.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+# Recycle workers now and then; with preload this is cheap
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = 100
+timeout = 30
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from library_app.warmup import warm_master
+    warm_master()
+    server.log.info("Warmed templates and URL patterns in master")
+
+
+def post_worker_init(worker):
+    from library_app.warmup import warm_templates, warm_urls, warm_worker
+    if not worker.cfg.preload_app:
+        warm_templates()
+        warm_urls()
+    warm_worker()
+    worker.log.info("Worker %s warmed up", worker.pid)
@@ -1,6 +1,248 @@
+import string
+
+from django import forms
 from django.contrib import admin
-from .models import Book, Reader, IssueBook
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
+
+from .models import (
+    Branch, StaffProfile, Category, Book, MembershipTier, Reader, IssueBook,
+    normalize_phone, normalize_email,
+)
+
+
+# ---------------- PAGINATOR ----------------
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids an exact COUNT(*) on large unfiltered tables.
+
+    Unfiltered changelists use the database's row estimate (pg_class on
+    PostgreSQL, sqlite_stat1 after ANALYZE, else MAX(pk) for integer keys).
+    Filtered/searched lists, and tables under the threshold, are counted
+    exactly.
+    """
+
+    ESTIMATE_THRESHOLD = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self._estimate()
+            if estimate is not None and estimate >= self.ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+    def _estimate(self):
+        model = self.object_list.model
+        connection = connections[self.object_list.db]
+        table = model._meta.db_table
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [connection.ops.quote_name(table)]
+                )
+                row = cursor.fetchone()
+                if row and row[0] > 0:
+                    return row[0]
+
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+                )
+                if cursor.fetchone():
+                    cursor.execute(
+                        # First number of any index's stat row is the row count
+                        "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1",
+                        [table]
+                    )
+                    row = cursor.fetchone()
+                    if row:
+                        return int(row[0].split()[0])
+
+        if model._meta.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+            # Gaps from deletes make this an over-estimate, which is fine
+            # for page links
+            return model._default_manager.using(
+                self.object_list.db
+            ).order_by('-pk').values_list('pk', flat=True).first()
+
+        return None
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) behind "N total"
+    show_full_result_count = False
+    list_per_page = 50
+
+    def search_q(self, term):
+        """Q object for one search term, using only indexed lookups.
+
+        Returning None, the default, searches ``search_fields`` the usual
+        Django way.
+        """
+        return None
+
+    def get_search_results(self, request, queryset, search_term):
+        # Django's search_fields always compile to LIKE ... ESCAPE, which
+        # SQLite can't answer from an index; search_q() builds exact
+        # matches and lower() ranges instead. search_fields then only
+        # labels the search box.
+        term = search_term.strip()
+        q = self.search_q(term) if term else None
+        if q is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(q), False
+
+
+# ---------------- SEARCH ----------------
+# SQLite's lower() only folds A-Z, so terms are folded the same way to
+# compare against the index
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def prefix_match(queryset, field, term):
+    """``queryset`` filtered to rows whose ``field`` starts with ``term``,
+    ignoring case, as a range over an index on Lower(field).
+
+    Non-ASCII letters are left as stored by lower(), so a term with any is
+    tried in its lower, upper, title and capitalized forms as well; each
+    is one more range on the same index.
+    """
+    variants = [term]
+    if not term.isascii():
+        variants += [term.lower(), term.upper(), term.title(), term.capitalize()]
+
+    alias = f'{field}_lower'
+    q = Q()
+    for prefix in sorted({v.translate(ASCII_LOWER) for v in variants}):
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        q |= Q(**{f'{alias}__gte': prefix, f'{alias}__lt': upper})
+    return queryset.alias(**{alias: Lower(field)}).filter(q)
+
+
+def book_search(term):
+    # ubno is matched as typed; unique per branch, indexed on its own
+    # for searches across branches
+    return (
+        Q(ubno=term)
+        | Q(pk__in=prefix_match(Book.objects.all(), 'title', term).values('pk'))
+    )
+
+
+def reader_search(term):
+    q = Q(pk__in=prefix_match(Reader.objects.all(), 'name', term).values('pk'))
+    if '@' in term:
+        q |= Q(email_normalized=normalize_email(term))
+    elif normalize_phone(term):
+        q |= Q(phone_normalized=normalize_phone(term))
+    return q
+
+
+# ---------------- BRANCH / STAFF ----------------
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code')
+    search_fields = ('name', '=code')
+
+
+@admin.register(StaffProfile)
+class StaffProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'branch')
+    list_select_related = ('user', 'branch')
+    list_filter = ('branch',)
+    search_fields = ('user__username',)
+    autocomplete_fields = ('user', 'branch')
+
+
+# ---------------- CATALOGUE ----------------
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+
+@admin.register(Book)
+class BookAdmin(LargeTableAdmin):
+    list_display = (
+        'title', 'author', 'ubno', 'category', 'branch',
+        'total_copies', 'available_copies',
+    )
+    list_select_related = ('category', 'branch')
+    list_filter = ('branch', 'category')
+    search_fields = ('=ubno', '^title')
+    autocomplete_fields = ('category', 'branch')
+
+    def search_q(self, term):
+        return book_search(term)
+
+
+# ---------------- READERS ----------------
+@admin.register(MembershipTier)
+class MembershipTierAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name', 'issue_limit')
+    # Changing a limit here only affects readers saved afterwards;
+    # run `manage.py retier_readers --sync` to apply it to everyone
+
+
+class MembershipFilter(admin.SimpleListFilter):
+    # Options come from the tier table instead of a DISTINCT over readers
+    title = 'membership'
+    parameter_name = 'membership'
+
+    def lookups(self, request, model_admin):
+        return MembershipTier.choices()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(membership=self.value())
+        return queryset
+
+
+@admin.register(Reader)
+class ReaderAdmin(LargeTableAdmin):
+    list_display = ('name', 'phone', 'email', 'membership', 'issue_limit', 'branch')
+    list_select_related = ('branch',)
+    list_filter = ('branch', MembershipFilter)
+    search_fields = ('^name', '=phone', '=email')
+    autocomplete_fields = ('branch',)
+
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        if db_field.name == 'membership':
+            # Callable choices are re-read each time the form is built
+            return forms.ChoiceField(
+                choices=MembershipTier.choices,
+                initial=db_field.default,
+                validators=db_field.validators,
+            )
+        return super().formfield_for_dbfield(db_field, request, **kwargs)
+
+    def search_q(self, term):
+        return reader_search(term)
+
+
+# ---------------- LOANS ----------------
+@admin.register(IssueBook)
+class IssueBookAdmin(LargeTableAdmin):
+    list_display = (
+        'book', 'reader', 'branch',
+        'issue_date', 'return_date', 'is_returned',
+    )
+    list_select_related = ('book', 'reader', 'branch')
+    list_filter = ('is_returned', 'branch')
+    search_fields = ('=book__ubno', '^book__title', '^reader__name', '=reader__phone')
+    date_hierarchy = 'issue_date'
+    autocomplete_fields = ('book', 'reader', 'branch')
 
-admin.site.register(Book)
-admin.site.register(Reader)
-admin.site.register(IssueBook)
+    def search_q(self, term):
+        # Matching books and readers are found through their own indexes,
+        # then loans through the book/reader FK indexes
+        return (
+            Q(book__in=Book.objects.filter(book_search(term)).values('pk'))
+            | Q(reader__in=Reader.objects.filter(reader_search(term)).values('pk'))
+        )
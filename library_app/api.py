@@ -0,0 +1,251 @@
+"""
+Read-only JSON API (v1) for kiosks and reporting.
+
+GET /api/v1/<resource>/ with:
+  fields=a,b,c   sparse fieldset; only those columns are selected
+  after=<key>    keyset cursor, the "next" value of the previous page
+  limit=<n>      page size (default 100, max 1000)
+plus the per-resource filters listed in RESOURCES.
+
+Rows are read with values_list() over the requested columns only, with
+related names joined in the same query, and serialized with orjson when
+it is installed.
+"""
+
+import hmac
+from datetime import date
+from uuid import UUID
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from .branches import staff_branch
+from .models import Branch, Category, Book, Reader, IssueBook
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the deployment
+    orjson = None
+    import json
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _bool(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+# fields: public name -> ORM lookup; only these are ever exposed.
+# filters: query parameter -> function building filter() kwargs.
+RESOURCES = {
+    'categories': {
+        'model': Category,
+        'key': 'id',
+        'branch': None,
+        'fields': {
+            'id': 'id',
+            'name': 'name',
+        },
+        'filters': {},
+    },
+    'books': {
+        'model': Book,
+        'key': 'id',
+        'branch': 'branch',
+        'fields': {
+            'id': 'id',
+            'title': 'title',
+            'author': 'author',
+            'ubno': 'ubno',
+            'category_id': 'category_id',
+            'category': 'category__name',
+            'total_copies': 'total_copies',
+            'available_copies': 'available_copies',
+            'branch': 'branch__code',
+        },
+        'filters': {
+            'category': lambda v: {'category_id': int(v)},
+            'available': lambda v: (
+                {'available_copies__gt': 0} if _bool(v) else {'available_copies': 0}
+            ),
+        },
+    },
+    'readers': {
+        # No phone, email or address over the API
+        'model': Reader,
+        'key': 'library_id',
+        'branch': 'branch',
+        'fields': {
+            'id': 'library_id',
+            'name': 'name',
+            'membership': 'membership',
+            'issue_limit': 'issue_limit',
+            'branch': 'branch__code',
+        },
+        'filters': {
+            'membership': lambda v: {'membership': v},
+        },
+    },
+    'loans': {
+        'model': IssueBook,
+        'key': 'id',
+        'branch': 'branch',
+        'fields': {
+            'id': 'id',
+            'book_id': 'book_id',
+            'book': 'book__title',
+            'reader_id': 'reader_id',
+            'reader': 'reader__name',
+            'issue_date': 'issue_date',
+            'return_date': 'return_date',
+            'is_returned': 'is_returned',
+            'branch': 'branch__code',
+        },
+        'filters': {
+            'reader': lambda v: {'reader_id': UUID(v)},
+            'book': lambda v: {'book_id': int(v)},
+            'is_returned': lambda v: {'is_returned': _bool(v)},
+        },
+    },
+}
+
+
+# ---------------- SERIALIZATION ----------------
+def _default(value):
+    if isinstance(value, (date, UUID)):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode()
+
+
+def json_response(payload, status=200):
+    return HttpResponse(dumps(payload), status=status, content_type='application/json')
+
+
+def _error(message, status=400):
+    return json_response({'error': message}, status=status)
+
+
+# ---------------- ACCESS ----------------
+def _valid_key(key):
+    # Compared in constant time against every configured key, so timing
+    # reveals neither how much of a key matched nor which one
+    key = key.encode()
+    valid = False
+    for configured in settings.API_KEYS:
+        valid |= hmac.compare_digest(key, configured.encode())
+    return valid
+
+
+def _api_branch(request):
+    """(allowed, branch) for a request.
+
+    Staff sessions are scoped to their own branch. Clients with an
+    X-API-Key from settings.API_KEYS may read the whole network or pick a
+    branch with ?branch=<code>; an unknown code raises ValueError.
+    """
+    if request.user.is_authenticated and request.user.is_staff:
+        branch = staff_branch(request)
+        return branch is not None, branch
+
+    key = request.headers.get('X-API-Key')
+    if key and _valid_key(key):
+        code = request.GET.get('branch')
+        if not code:
+            return True, None
+        branch = Branch.objects.filter(code=code).first()
+        if branch is None:
+            raise ValueError("Unknown branch")
+        return True, branch
+
+    return False, None
+
+
+# ---------------- QUERY ----------------
+def page(resource, params, branch=None):
+    """One page of rows as dicts, and the cursor for the next page.
+
+    Raises ValueError with a client-facing message for bad parameters.
+    """
+    spec = RESOURCES[resource]
+    exposed = spec['fields']
+
+    if params.get('fields'):
+        names = [name.strip() for name in params['fields'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in exposed]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        names = list(exposed)
+
+    key = spec['key']
+    # The key is always read to build the cursor, even when not requested
+    lookups = [exposed[name] for name in names]
+    key_index = lookups.index(key) if key in lookups else None
+    if key_index is None:
+        lookups.append(key)
+        key_index = len(lookups) - 1
+
+    qs = spec['model'].objects.all()
+    if branch is not None and spec['branch']:
+        qs = qs.filter(**{spec['branch']: branch})
+
+    for param, build in spec['filters'].items():
+        if param in params:
+            try:
+                qs = qs.filter(**build(params[param]))
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for {param}")
+
+    try:
+        limit = min(int(params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise ValueError("limit must be a number")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    if params.get('after'):
+        after = params['after']
+        try:
+            after = UUID(after) if key == 'library_id' else int(after)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        qs = qs.filter(**{f'{key}__gt': after})
+
+    rows = list(qs.order_by(key).values_list(*lookups)[:limit + 1])
+
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cursor = rows[-1][key_index]
+
+    data = [dict(zip(names, row)) for row in rows]
+    return data, cursor
+
+
+# ---------------- VIEW ----------------
+@require_GET
+def resource_list(request, resource):
+    if resource not in RESOURCES:
+        return _error("Unknown resource", status=404)
+
+    try:
+        allowed, branch = _api_branch(request)
+        if not allowed:
+            return _error("Authentication required", status=401)
+        data, cursor = page(resource, request.GET, branch)
+    except ValueError as e:
+        return _error(str(e))
+
+    return json_response({
+        'data': data,
+        'next': str(cursor) if cursor is not None else None,
+    })
@@ -0,0 +1,28 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+USER_CACHE_SECONDS = 300
+
+
+def user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that keeps the logged-in user in the shared cache.
+
+    AuthenticationMiddleware calls get_user() on every request; with this
+    backend that is a cache hit instead of an auth_user query. Entries are
+    dropped whenever the user is saved or deleted (see signals.py), so
+    password changes and deactivation take effect immediately.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, USER_CACHE_SECONDS)
+        return user
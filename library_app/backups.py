@@ -0,0 +1,307 @@
+"""
+Online snapshots of the SQLite database.
+
+Snapshots use SQLite's backup API in steps of a few hundred pages. On a
+WAL database the copy reads one pinned snapshot, so writers are never
+blocked and the copy never restarts. With a rollback journal the read
+lock is dropped for a short sleep between steps, but every commit
+restarts the copy, and after MAX_RESTARTS the rest is copied under one
+lock; use WAL for multi-GB databases. Each snapshot is checked,
+gzip-compressed and rotated. restore_snapshot copies a verified snapshot back over the live
+database through the same API.
+
+Snapshot names carry microseconds and are created exclusively, so an
+existing snapshot is never overwritten.
+"""
+
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+
+SNAPSHOT_GLOB = 'library-*.sqlite3.gz'
+DEFAULT_PAGES = 256
+DEFAULT_SLEEP = 0.02
+# A write from another connection restarts a paged backup; after this many
+# restarts, copy the rest in one step instead of chasing a busy database
+MAX_RESTARTS = 5
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def database_path():
+    db = settings.DATABASES['default']
+    if db['ENGINE'] != 'django.db.backends.sqlite3':
+        raise BackupError("Online backup only supports the SQLite backend")
+    return Path(db['NAME'])
+
+
+def backup_dir():
+    return Path(settings.BACKUP_DIR)
+
+
+def integrity_check(path, full=False):
+    """Check a database file; raise BackupError on problems.
+
+    Runs PRAGMA quick_check, or with ``full`` the much slower
+    integrity_check, which also verifies every index against its table
+    (minutes per GB).
+    """
+    pragma = 'integrity_check' if full else 'quick_check'
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            rows = [row[0] for row in conn.execute(f'PRAGMA {pragma}')]
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"Integrity check failed for {path}: {e}")
+    if rows != ['ok']:
+        raise BackupError(f"Integrity check failed for {path}: {'; '.join(rows[:5])}")
+
+
+def copy_database(source, target, pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, standalone=False):
+    """Copy ``source`` into ``target`` with the online backup API.
+
+    ``standalone`` switches the copy to a rollback journal, so a snapshot of
+    a WAL database is a single self-contained file. Returns the number of
+    times the copy restarted because of concurrent writes.
+    """
+    state = {'remaining': None, 'restarts': 0}
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    wal = src.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    def progress(status, remaining, total):
+        # A step that copied pages but made no progress started over; when
+        # every step is interrupted, remaining just repeats
+        if (
+            status == sqlite3.SQLITE_OK
+            and state['remaining'] is not None
+            and remaining >= state['remaining']
+        ):
+            state['restarts'] += 1
+            if state['restarts'] >= MAX_RESTARTS:
+                raise _Restarted()
+        state['remaining'] = remaining
+        # sqlite3's own sleep only applies to busy retries; this is the
+        # pause in which rollback-journal writers can commit
+        if not wal and sleep and remaining:
+            time.sleep(sleep)
+
+    try:
+        if wal:
+            # A read transaction pins the snapshot being copied; in WAL
+            # mode it doesn't block writers, and their commits no longer
+            # restart the copy
+            src.execute('BEGIN')
+            src.execute('SELECT count(*) FROM sqlite_master').fetchone()
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+        except _Restarted:
+            # Holds the read lock for the whole copy, but always finishes
+            src.backup(dst, pages=-1)
+        if standalone:
+            dst.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        dst.close()
+        src.close()
+
+    return state['restarts']
+
+
+# ---------------- SNAPSHOTS ----------------
+def _publish(partial, final):
+    """Move ``partial`` to ``final``, failing instead of replacing a file."""
+    try:
+        os.link(partial, final)
+    except FileExistsError:
+        raise BackupError(f"Snapshot {final} already exists")
+    partial.unlink()
+
+
+def create_snapshot(pages=DEFAULT_PAGES, sleep=DEFAULT_SLEEP, compress=True, full_check=False):
+    """Write a verified snapshot of the live database; return (path, stats)."""
+    source = database_path()
+    directory = backup_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S-%f')
+    raw = directory / f'library-{stamp}.sqlite3'
+    final = raw.with_name(raw.name + '.gz') if compress else raw
+    fd, partial = tempfile.mkstemp(dir=directory, prefix=f'.{raw.name}-', suffix='.partial')
+    os.close(fd)
+    partial = Path(partial)
+
+    started = time.perf_counter()
+    try:
+        restarts = copy_database(source, partial, pages=pages, sleep=sleep, standalone=True)
+        copy_seconds = time.perf_counter() - started
+        integrity_check(partial, full=full_check)
+        check_seconds = time.perf_counter() - started - copy_seconds
+
+        if compress:
+            packed = partial.with_suffix('.gz.partial')
+            with open(partial, 'rb') as src, gzip.open(packed, 'xb', compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, length=1024 * 1024)
+            try:
+                _publish(packed, final)
+            finally:
+                packed.unlink(missing_ok=True)
+        else:
+            _publish(partial, final)
+    finally:
+        partial.unlink(missing_ok=True)
+
+    return final, {
+        'copy_seconds': copy_seconds,
+        'check_seconds': check_seconds,
+        'total_seconds': time.perf_counter() - started,
+        'restarts': restarts,
+        'source_bytes': source.stat().st_size,
+        'snapshot_bytes': final.stat().st_size,
+    }
+
+
+def list_snapshots():
+    """Snapshots in the backup directory, newest first."""
+    directory = backup_dir()
+    snapshots = list(directory.glob(SNAPSHOT_GLOB)) + list(directory.glob('library-*.sqlite3'))
+    return sorted(snapshots, key=lambda p: p.name, reverse=True)
+
+
+def rotate_snapshots(keep):
+    """Delete all but the newest ``keep`` snapshots; return the deleted paths."""
+    old = list_snapshots()[keep:]
+    for path in old:
+        path.unlink(missing_ok=True)
+    return old
+
+
+def _unpacked(snapshot, directory):
+    """Private, uncompressed copy of ``snapshot`` inside ``directory``.
+
+    Plain snapshots are copied too, so rotation or a new snapshot can't
+    touch the file being restored.
+    """
+    target = directory / snapshot.name.removesuffix('.gz')
+    opener = gzip.open if snapshot.suffix == '.gz' else open
+    try:
+        with opener(snapshot, 'rb') as src, open(target, 'wb') as dst:
+            shutil.copyfileobj(src, dst, length=1024 * 1024)
+    except (OSError, EOFError) as e:
+        raise BackupError(f"Cannot read {snapshot}: {e}")
+    return target
+
+
+def _work_dir(prefix):
+    directory = backup_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(dir=directory, prefix=prefix))
+
+
+def verify_snapshot(snapshot, full=False):
+    """Decompress (if needed) and check a snapshot."""
+    snapshot = Path(snapshot)
+    work = _work_dir('.verify-')
+    try:
+        integrity_check(_unpacked(snapshot, work), full=full)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def restore_snapshot(snapshot, safety=True, full_check=False):
+    """Replace the live database contents with a verified snapshot.
+
+    The snapshot is unpacked and checked first; only then, with ``safety``,
+    is the current database saved as a new snapshot. Returns the path of
+    that safety snapshot, or None. Writers are blocked for the duration of
+    the copy; stop the workers first on a busy deployment.
+    """
+    snapshot = Path(snapshot)
+    work = _work_dir('.restore-')
+    try:
+        unpacked = _unpacked(snapshot, work)
+        integrity_check(unpacked, full=full_check)
+        saved = create_snapshot()[0] if safety else None
+        copy_database(unpacked, database_path(), pages=-1)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    integrity_check(database_path())
+    return saved
+
+
+# ---------------- WRITE STALL PROBE ----------------
+# Rewrites one django_migrations row with its own values: a real page
+# write and commit on the live database that changes no data and adds no
+# tables, so snapshots taken while probing are clean. Setting a non-key
+# column to itself is skipped by SQLite; rewriting the rowid is not.
+PROBE_SQL = (
+    'UPDATE django_migrations SET id = id '
+    'WHERE id = (SELECT MIN(id) FROM django_migrations)'
+)
+
+
+class WriteProbe:
+    """Commits a no-op write every ``interval`` seconds in a thread and
+    records how long each commit took, to measure writer stalls while a
+    backup runs."""
+
+    def __init__(self, path, interval=0.01):
+        self.path = path
+        self.interval = interval
+        self.latencies = []
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        # Same busy timeout Django's default sqlite connection uses
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            while not self._stop.wait(self.interval):
+                started = time.perf_counter()
+                try:
+                    with conn:
+                        conn.execute(PROBE_SQL)
+                except sqlite3.OperationalError:
+                    # "database is locked" after the busy timeout
+                    self.failures += 1
+                    continue
+                self.latencies.append(time.perf_counter() - started)
+        finally:
+            conn.close()
+
+    def summary(self):
+        if not self.latencies:
+            return {'writes': 0, 'failures': self.failures}
+        ordered = sorted(self.latencies)
+        return {
+            'writes': len(ordered),
+            'failures': self.failures,
+            'median_ms': ordered[len(ordered) // 2] * 1000,
+            'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
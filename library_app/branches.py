@@ -0,0 +1,69 @@
+import time
+
+from django.core.cache import cache
+
+from .models import Branch, StaffProfile
+
+
+BRANCH_CACHE_SECONDS = 300
+GENERATION_KEY = 'staff_branch:generation'
+
+
+def _cache_key(user_id):
+    # Replacing the generation invalidates every user's entry at once, for
+    # changes (a new branch, a moved profile) that can affect anyone. It
+    # is a timestamp rather than a counter, so if the key is culled or
+    # evicted the next one is new too and never revives older entries.
+    generation = cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+    return f'staff_branch:{generation}:{user_id}'
+
+
+def invalidate_staff_branches():
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def forget_staff_branch(user_id):
+    cache.delete(_cache_key(user_id))
+
+
+def _lookup_branch(user):
+    profile = (
+        StaffProfile.objects
+        .select_related('branch')
+        .filter(user=user)
+        .first()
+    )
+    if profile:
+        return profile.branch
+
+    branches = list(Branch.objects.all()[:2])
+    if len(branches) == 1:
+        return branches[0]
+    return None
+
+
+def staff_branch(request):
+    """Branch the logged-in staff member works at, or None.
+
+    Staff without a StaffProfile fall back to the only branch when the
+    deployment has just one, so single-site installs need no setup.
+    The result is cached on the request, per user so a login that swaps
+    request.user looks the new user up, and in the shared cache.
+    """
+    user_id = request.user.pk if request.user.is_authenticated else None
+    cached = getattr(request, '_staff_branch', None)
+    if cached is not None and cached[0] == user_id:
+        return cached[1]
+
+    branch = None
+    if user_id is not None:
+        key = _cache_key(user_id)
+        # Wrapped in a tuple so a cached "no branch" is told apart from a miss
+        stored = cache.get(key)
+        if stored is None:
+            stored = (_lookup_branch(request.user),)
+            cache.set(key, stored, BRANCH_CACHE_SECONDS)
+        branch = stored[0]
+
+    request._staff_branch = (user_id, branch)
+    return branch
@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from library_app.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild circulation rollups from the raw issue/return history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start', type=date.fromisoformat,
+            help="First day to rebuild (YYYY-MM-DD), widened to the month start",
+        )
+        parser.add_argument(
+            '--end', type=date.fromisoformat,
+            help="Last day to rebuild (YYYY-MM-DD), widened to the month end",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} rollup rows"
+        ))
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app.backups import (
+    DEFAULT_PAGES,
+    DEFAULT_SLEEP,
+    BackupError,
+    WriteProbe,
+    create_snapshot,
+    database_path,
+    rotate_snapshots,
+)
+
+
+class Command(BaseCommand):
+    help = "Take an online, compressed snapshot of the SQLite database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages', type=int, default=DEFAULT_PAGES,
+            help="Pages copied per step; the database is unlocked between steps",
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=DEFAULT_SLEEP,
+            help="Seconds to pause between steps",
+        )
+        parser.add_argument('--keep', type=int, default=settings.BACKUP_KEEP)
+        parser.add_argument('--no-compress', action='store_true')
+        parser.add_argument(
+            '--full-check', action='store_true',
+            help="Run the full integrity_check instead of quick_check (slow on large databases)",
+        )
+        parser.add_argument(
+            '--measure-writes', action='store_true',
+            help="Commit probe writes during the backup and report how long they stall",
+        )
+
+    def handle(self, *args, **options):
+        # Rotation runs after the new snapshot is written, so 0 would
+        # delete that one too
+        if options['keep'] < 1:
+            raise CommandError("--keep must be at least 1")
+
+        kwargs = {
+            'pages': options['pages'],
+            'sleep': options['sleep'],
+            'compress': not options['no_compress'],
+            'full_check': options['full_check'],
+        }
+
+        try:
+            if options['measure_writes']:
+                with WriteProbe(database_path()) as probe:
+                    path, stats = create_snapshot(**kwargs)
+            else:
+                probe = None
+                path, stats = create_snapshot(**kwargs)
+        except BackupError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot {path} ({stats['source_bytes'] / 1e6:.1f} MB -> "
+            f"{stats['snapshot_bytes'] / 1e6:.1f} MB) in {stats['total_seconds']:.2f}s, "
+            f"copy {stats['copy_seconds']:.2f}s, check {stats['check_seconds']:.2f}s, "
+            f"{stats['restarts']} restarts"
+        ))
+
+        if probe is not None:
+            result = probe.summary()
+            if result['writes']:
+                self.stdout.write(
+                    f"Probe writes: {result['writes']} committed, {result['failures']} failed; "
+                    f"median {result['median_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+                    f"max stall {result['max_ms']:.1f} ms"
+                )
+            else:
+                self.stdout.write(f"Probe writes: none committed, {result['failures']} failed")
+
+        for old in rotate_snapshots(options['keep']):
+            self.stdout.write(f"Removed old snapshot {old.name}")
@@ -0,0 +1,125 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from library_app import api
+from library_app.models import Branch, Category, Book, Reader, IssueBook
+
+
+# Keeps the benchmark's session and user out of the deployment's cache
+BENCH_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+LOANS_PER_READER = 100
+
+
+class Command(BaseCommand):
+    help = "Compare JSON API throughput with the HTML views it replaces"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--rows', type=int, default=1000, help="API page size")
+        parser.add_argument(
+            '--books', type=int, default=2000,
+            help="Books seeded into the benchmark database, one loan each",
+        )
+
+    def handle(self, *args, **options):
+        # Runs against a freshly migrated and seeded test database, like
+        # the test suite, so the live database is never written or locked
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(CACHES=BENCH_CACHES):
+                self.run(options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def seed(self, count):
+        """``count`` books, each lent once, LOANS_PER_READER loans per reader."""
+        branch = Branch.objects.get(code='MAIN')
+        category = Category.objects.create(name='Bench API')
+        books = Book.objects.bulk_create(
+            Book(
+                branch=branch, title=f'Bench {i:06d}', author='Bench',
+                ubno=f'BENCH-{i}', category=category,
+            )
+            for i in range(count)
+        )
+        readers = Reader.objects.bulk_create(
+            Reader(
+                branch=branch, name=f'Bench {i}', phone=f'9{i:09d}',
+                phone_normalized=f'9{i:09d}', email=f'bench{i}@example.invalid',
+                email_normalized=f'bench{i}@example.invalid', address='-',
+            )
+            for i in range(-(-count // LOANS_PER_READER))
+        )
+        IssueBook.objects.bulk_create(
+            IssueBook(
+                branch=branch, book=book, reader=readers[i // LOANS_PER_READER],
+                category=category, membership='BASIC',
+            )
+            for i, book in enumerate(books)
+        )
+        return readers[0] if readers else None
+
+    def run(self, options):
+        user = get_user_model().objects.create_user('bench-api', is_staff=True)
+        reader = self.seed(options['books'])
+
+        client = Client()
+        client.force_login(user)
+        rows = options['rows']
+
+        self.bench_serialization(rows)
+
+        pairs = [(
+            "books",
+            '/view_book/',
+            f'/api/v1/books/?limit={rows}',
+        )]
+        if reader:
+            pairs.append((
+                "reader loans",
+                f'/reader-history/{reader.library_id}/',
+                f'/api/v1/loans/?reader={reader.library_id}&limit={rows}'
+                '&fields=id,book,issue_date,return_date,is_returned',
+            ))
+
+        for label, html_url, api_url in pairs:
+            html = self.throughput(client, html_url, options['requests'])
+            json_ = self.throughput(client, api_url, options['requests'])
+            self.stdout.write(
+                f"{label:>13}: HTML {html:8.1f} req/s   API {json_:8.1f} req/s   "
+                f"({json_ / html:.1f}x)"
+            )
+
+    def bench_serialization(self, rows):
+        started = time.perf_counter()
+        data, _ = api.page('loans', {'limit': str(rows)})
+        query_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        body = api.dumps({'data': data, 'next': None})
+        dump_ms = (time.perf_counter() - started) * 1000
+
+        encoder = "orjson" if api.orjson is not None else "json"
+        self.stdout.write(
+            f"{len(data)} loan rows: query {query_ms:.1f} ms, "
+            f"{encoder} serialize {dump_ms:.2f} ms ({len(body)} bytes)"
+        )
+
+    def throughput(self, client, url, count):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+
+        started = time.perf_counter()
+        for _ in range(count):
+            client.get(url)
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,106 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from library_app.models import Branch, Category, Book, Reader, IssueBook
+
+
+BASELINE = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'MESSAGE_STORAGE': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+}
+
+# Keeps the benchmark's sessions and users out of the deployment's cache
+BENCH_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+TABLES = ('django_session', 'auth_user', 'staff_profile')
+
+
+class Command(BaseCommand):
+    help = "Count queries per circulation action with DB sessions vs the cached session/auth setup"
+
+    def handle(self, *args, **options):
+        # Runs against a freshly migrated test database, like the test
+        # suite, so the live database is never written or locked
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(CACHES=BENCH_CACHES):
+                self.run()
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def run(self):
+        user = get_user_model().objects.create_user('bench-sessions', is_staff=True)
+        branch = Branch.objects.get(code='MAIN')
+        category = Category.objects.create(name='Bench Sessions')
+        book = Book.objects.create(
+            branch=branch, title='Bench', author='Bench', ubno='BENCH-SESSIONS',
+            category=category, total_copies=5, available_copies=5,
+        )
+        reader = Reader.objects.create(
+            branch=branch, name='Bench', phone='0000000001',
+            email='bench-sessions@example.invalid', address='-',
+        )
+
+        with override_settings(**BASELINE):
+            baseline = self.cycle(user, book, reader)
+        cached = self.cycle(user, book, reader)
+
+        header = f"{'action':<16}{'db sessions':>14}{'cached':>10}{'saved':>8}"
+        self.stdout.write(header)
+        for action in baseline:
+            before, after = baseline[action]['total'], cached[action]['total']
+            self.stdout.write(f"{action:<16}{before:>14}{after:>10}{before - after:>8}")
+
+        for table in TABLES:
+            before = sum(counts[table] for counts in baseline.values())
+            after = sum(counts[table] for counts in cached.values())
+            self.stdout.write(f"  {table}: {before} -> {after} queries over the cycle")
+
+    def cycle(self, user, book, reader):
+        """Issue and return one book, counting queries per request."""
+        client = Client()
+        client.force_login(user)
+        issue_url = f'/issue_book/?reader_id={reader.library_id}'
+        # Warm the session and user caches, as on any request after login
+        client.get(issue_url)
+
+        results = {}
+        results['issue page'] = self.count(client.get, issue_url)
+        results['issue POST'] = self.count(
+            client.post, '/issue_book/',
+            {'reader_id': reader.library_id, 'book_id': book.id},
+        )
+        issue = IssueBook.objects.get(reader=reader, is_returned=False)
+        results['return page'] = self.count(
+            client.get, f'/return-book/?reader_key={reader.library_id}'
+        )
+        results['return POST'] = self.count(client.post, '/return-book/', {'issue_id': issue.id})
+        results['redirect page'] = self.count(client.get, '/return-book/')
+
+        client.logout()
+        IssueBook.objects.filter(pk=issue.pk).delete()
+        return results
+
+    def count(self, method, *args):
+        with CaptureQueriesContext(connection) as ctx:
+            method(*args)
+        counts = Counter(total=len(ctx.captured_queries))
+        for query in ctx.captured_queries:
+            for table in TABLES:
+                if f'"{table}"' in query['sql']:
+                    counts[table] += 1
+        return counts
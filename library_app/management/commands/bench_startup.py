@@ -0,0 +1,85 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter, like a newly forked gunicorn worker without
+# preload: import the WSGI app, optionally warm up, then serve one request
+# and run one query.
+WORKER_SCRIPT = r'''
+import io, json, sys, time
+
+t0 = time.perf_counter()
+from library_management.wsgi import application
+t1 = time.perf_counter()
+
+if sys.argv[1] == "warm":
+    from library_app.warmup import warm_templates, warm_urls, warm_worker
+    warm_templates()
+    warm_urls()
+    warm_worker()
+t2 = time.perf_counter()
+
+environ = {
+    "REQUEST_METHOD": "GET", "PATH_INFO": sys.argv[2], "QUERY_STRING": "",
+    "SERVER_NAME": "localhost", "SERVER_PORT": "8000", "HTTP_HOST": "localhost",
+    "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr,
+}
+status = []
+body = b"".join(application(environ, lambda s, h, *a: status.append(s)))
+t3 = time.perf_counter()
+
+from library_app.models import MembershipTier
+MembershipTier.limits()
+t4 = time.perf_counter()
+
+print(json.dumps({
+    "status": status[0],
+    "import_ms": (t1 - t0) * 1000,
+    "warmup_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "first_lookup_ms": (t4 - t3) * 1000,
+}))
+'''
+
+COLUMNS = ('import_ms', 'warmup_ms', 'first_request_ms', 'first_lookup_ms')
+
+
+class Command(BaseCommand):
+    help = "Measure worker import time and first-request latency, cold vs warmed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/login/', help="URL of the first request")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'mode':>6}  " + "  ".join(f"{c:>16}" for c in COLUMNS))
+
+        for mode in ('cold', 'warm'):
+            runs = [self.run_worker(mode, options['path']) for _ in range(options['runs'])]
+            medians = [statistics.median(run[c] for run in runs) for c in COLUMNS]
+            self.stdout.write(f"{mode:>6}  " + "  ".join(f"{m:16.1f}" for m in medians))
+
+        self.stdout.write(
+            "Medians in ms. With preload_app, import and template compilation "
+            "happen once in the master; workers only pay the warm-up row."
+        )
+
+    def run_worker(self, mode, path):
+        result = subprocess.run(
+            [sys.executable, '-c', WORKER_SCRIPT, mode, path],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        if not run['status'].startswith('200'):
+            raise CommandError(f"{path} returned {run['status']}")
+        return run
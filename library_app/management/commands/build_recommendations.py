@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from library_app.recommendations import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_MAX_BASKET,
+    DEFAULT_SHARD_SIZE,
+    DEFAULT_TOP_K,
+    build_recommendations,
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild 'readers who borrowed this also borrowed' recommendations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+        parser.add_argument(
+            '--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+            help="Books whose neighbours are counted per pass over the loans",
+        )
+        parser.add_argument(
+            '--max-basket', type=int, default=DEFAULT_MAX_BASKET,
+            help="Ignore readers who borrowed more distinct books than this",
+        )
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+
+        written = build_recommendations(
+            top_k=options['top_k'],
+            shard_size=options['shard_size'],
+            max_basket=options['max_basket'],
+            chunk_size=options['chunk_size'],
+            log=log,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} book recommendations"
+        ))
@@ -0,0 +1,33 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in small batches (a cron-friendly clearsessions)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--pause', type=float, default=0.05,
+            help="Seconds between batches, so desk writes are not held up",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = Session.objects.filter(expire_date__lt=now)
+        deleted = 0
+
+        # Short DELETEs over the expire_date index instead of one long
+        # transaction that would lock SQLite for the whole cleanup
+        while True:
+            keys = list(expired.values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            Session.objects.filter(session_key__in=keys).delete()
+            deleted += len(keys)
+            time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired sessions"))
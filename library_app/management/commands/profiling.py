@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library_app.profiling import is_enabled, list_captures, set_enabled
+
+
+class Command(BaseCommand):
+    help = "Turn the request profiler on or off, or show its status"
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['on', 'off', 'status'])
+
+    def handle(self, *args, **options):
+        action = options['action']
+
+        if action == 'on':
+            set_enabled(True)
+        elif action == 'off':
+            set_enabled(False)
+            if settings.PROFILING_ENABLED:
+                self.stdout.write(self.style.WARNING(
+                    "PROFILING_ENABLED is set, profiling stays on"
+                ))
+
+        state = "on" if is_enabled() else "off"
+        self.stdout.write(
+            f"Profiling is {state}: sampling {settings.PROFILING_SAMPLE_RATE:.1%} "
+            f"of requests plus any over {settings.PROFILING_SLOW_MS:g} ms, "
+            f"{len(list_captures(limit=None))} captures in {settings.PROFILING_DIR}"
+        )
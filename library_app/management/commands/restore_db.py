@@ -0,0 +1,79 @@
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app.backups import (
+    BackupError,
+    list_snapshots,
+    restore_snapshot,
+    verify_snapshot,
+)
+
+
+class Command(BaseCommand):
+    help = "Verify a snapshot, or restore it over the live SQLite database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'snapshot', nargs='?',
+            help="Snapshot file (default: the newest one in BACKUP_DIR)",
+        )
+        parser.add_argument(
+            '--verify-only', action='store_true',
+            help="Only decompress and integrity-check the snapshot",
+        )
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false', dest='interactive',
+            help="Do not prompt for confirmation",
+        )
+        parser.add_argument(
+            '--full-check', action='store_true',
+            help="Run the full integrity_check instead of quick_check",
+        )
+        parser.add_argument(
+            '--no-safety-snapshot', action='store_true',
+            help="Skip snapshotting the current database before restoring",
+        )
+
+    def handle(self, *args, **options):
+        if options['snapshot']:
+            snapshot = Path(options['snapshot'])
+        else:
+            snapshots = list_snapshots()
+            if not snapshots:
+                raise CommandError("No snapshots found")
+            snapshot = snapshots[0]
+
+        if not snapshot.is_file():
+            raise CommandError(f"Snapshot {snapshot} does not exist")
+
+        try:
+            if options['verify_only']:
+                verify_snapshot(snapshot, full=options['full_check'])
+                self.stdout.write(self.style.SUCCESS(f"{snapshot} is intact"))
+                return
+
+            if options['interactive']:
+                answer = input(
+                    f"This replaces the live database with {snapshot.name}. "
+                    "Stop the app servers first. Type 'yes' to continue: "
+                )
+                if answer != 'yes':
+                    raise CommandError("Restore cancelled")
+
+            safety = restore_snapshot(
+                snapshot,
+                safety=not options['no_safety_snapshot'],
+                full_check=options['full_check'],
+            )
+        except BackupError as e:
+            raise CommandError(str(e))
+
+        if safety is not None:
+            self.stdout.write(f"Saved previous database as {safety}")
+
+        # Cached sessions and users describe the database we just replaced
+        cache.clear()
+
+        self.stdout.write(self.style.SUCCESS(f"Restored {snapshot}"))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app.models import Branch, MembershipTier
+from library_app.tiers import DEFAULT_CHUNK_SIZE, retier, sync_limits
+
+
+class Command(BaseCommand):
+    help = "Bulk move readers between membership tiers, or re-apply changed tier limits"
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--to', dest='to_tier', help="Tier code to move readers to")
+        target.add_argument(
+            '--sync', action='store_true',
+            help="Re-apply every tier's current issue limit to its readers",
+        )
+        parser.add_argument('--from', dest='from_tier', help="Only move readers on this tier")
+        parser.add_argument('--branch', help="Only readers of this branch code")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would change and who would exceed the new limit",
+        )
+        parser.add_argument(
+            '--show', type=int, default=20,
+            help="How many over-limit readers to list",
+        )
+
+    def handle(self, *args, **options):
+        branch = None
+        if options['branch']:
+            branch = Branch.objects.filter(code=options['branch']).first()
+            if branch is None:
+                raise CommandError(f"Unknown branch '{options['branch']}'")
+
+        known = MembershipTier.limits()
+        for option in ('to_tier', 'from_tier'):
+            code = options[option]
+            if code and code not in known:
+                raise CommandError(f"Unknown membership tier '{code}'")
+
+        kwargs = {
+            'branch': branch,
+            'chunk_size': options['chunk_size'],
+            'dry_run': options['dry_run'],
+        }
+        if options['sync']:
+            results = sync_limits(**kwargs)
+        else:
+            results = {
+                options['to_tier']: retier(
+                    options['to_tier'], options['from_tier'], **kwargs
+                )
+            }
+
+        verb = "Would update" if options['dry_run'] else "Updated"
+        for code, (changed, over_limit) in results.items():
+            limit = known[code]
+            self.stdout.write(f"{verb} {changed} readers to {code} (limit {limit})")
+
+            over_count = over_limit.count() if options['dry_run'] else len(over_limit)
+            if over_count:
+                self.stdout.write(self.style.WARNING(
+                    f"  {over_count} readers hold more than {limit} open loans"
+                ))
+                for reader in over_limit[:options['show']]:
+                    self.stdout.write(
+                        f"  {reader.library_id} {reader.name}: {reader.open_loans} open"
+                    )
@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library_app.rollups import diff_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute circulation rollups from raw data and diff against stored rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat)
+        parser.add_argument('--end', type=date.fromisoformat)
+
+    def handle(self, *args, **options):
+        diffs = diff_rollups(options['start'], options['end'])
+
+        for (period, period_start, branch_id, category_id, membership), have, want in diffs:
+            self.stdout.write(
+                f"{period} {period_start} branch={branch_id} category={category_id} "
+                f"membership={membership}: stored={have} expected={want}"
+            )
+
+        if diffs:
+            raise CommandError(f"{len(diffs)} rollup rows differ")
+
+        self.stdout.write(self.style.SUCCESS("Rollups match raw data"))
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:26
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0004_rename_max_books_reader_issue_limit_and_more'),
+    ]
+
+    operations = [
+        # The first seven operations are not part of the recommendations
+        # change. models.py had drifted from 0001-0004 at the baseline
+        # (PositiveIntegerField copies, related_names, IssueBook ordering,
+        # library_id without the redundant unique=True) and makemigrations
+        # picked the drift up here. The copies fields gain CHECK
+        # constraints, so SQLite rebuilds book. They stay in this migration
+        # because it is already applied on existing databases.
+        migrations.AlterModelOptions(
+            name='issuebook',
+            options={'ordering': ['-issue_date']},
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='available_copies',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='books', to='library_app.category'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='total_copies',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='issuebook',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='issues', to='library_app.book'),
+        ),
+        migrations.AlterField(
+            model_name='issuebook',
+            name='reader',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='issued_books', to='library_app.reader'),
+        ),
+        migrations.AlterField(
+            model_name='reader',
+            name='library_id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        # Recommendations
+        migrations.CreateModel(
+            name='BookRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(default=0)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='library_app.book')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='library_app.book')),
+            ],
+            options={
+                'db_table': 'book_recommendation',
+                'ordering': ['book', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('book', 'recommended'), name='unique_book_recommendation')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0005_bookrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('D', 'Daily'), ('M', 'Monthly')], max_length=1)),
+                ('period_start', models.DateField()),
+                ('membership', models.CharField(choices=[('BASIC', 'Basic'), ('PREMIUM', 'Premium'), ('VIP', 'VIP')], max_length=10)),
+                ('loans', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('active_readers', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='library_app.category')),
+            ],
+            options={
+                'db_table': 'circulation_rollup',
+                'ordering': ['period', 'period_start'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'category', 'membership'), name='unique_circulation_rollup')],
+            },
+        ),
+    ]
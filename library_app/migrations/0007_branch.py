@@ -0,0 +1,102 @@
+# Generated by Django 5.2.8 on 2026-10-19 05:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_default_branch(apps, schema_editor):
+    # Existing single-site data all belongs to the original branch
+    Branch = apps.get_model('library_app', 'Branch')
+    branch, _ = Branch.objects.get_or_create(code='MAIN', defaults={'name': 'Main Branch'})
+
+    for model_name in ('Book', 'Reader', 'IssueBook'):
+        apps.get_model('library_app', model_name).objects.update(branch=branch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0006_circulationrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('code', models.CharField(max_length=10, unique=True)),
+            ],
+            options={
+                'db_table': 'branch',
+            },
+        ),
+        migrations.CreateModel(
+            name='StaffProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='staff', to='library_app.branch')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='staff_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'staff_profile',
+            },
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='branch',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='books', to='library_app.branch'),
+        ),
+        migrations.AddField(
+            model_name='reader',
+            name='branch',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='readers', to='library_app.branch'),
+        ),
+        migrations.AddField(
+            model_name='issuebook',
+            name='branch',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='issues', to='library_app.branch'),
+        ),
+        migrations.RunPython(assign_default_branch, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='book',
+            name='branch',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='books', to='library_app.branch'),
+        ),
+        migrations.AlterField(
+            model_name='reader',
+            name='branch',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='readers', to='library_app.branch'),
+        ),
+        migrations.AlterField(
+            model_name='issuebook',
+            name='branch',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='issues', to='library_app.branch'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['branch', 'title'], name='book_branch_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['branch', 'category'], name='book_branch_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reader',
+            index=models.Index(fields=['branch', 'name'], name='reader_branch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reader',
+            index=models.Index(fields=['branch', 'phone'], name='reader_branch_phone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuebook',
+            index=models.Index(fields=['branch', 'is_returned', 'reader'], name='issue_branch_open_reader_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuebook',
+            index=models.Index(fields=['branch', 'issue_date'], name='issue_branch_date_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:02
+
+from django.db import migrations, models
+
+
+DEFAULT_TIERS = [
+    ('BASIC', 'Basic', 3),
+    ('PREMIUM', 'Premium', 5),
+    ('VIP', 'VIP', 10),
+]
+
+
+def seed_tiers(apps, schema_editor):
+    # Same limits Reader.save() used to hard-code
+    MembershipTier = apps.get_model('library_app', 'MembershipTier')
+    for code, name, issue_limit in DEFAULT_TIERS:
+        MembershipTier.objects.get_or_create(
+            code=code,
+            defaults={'name': name, 'issue_limit': issue_limit}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0007_branch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=10, unique=True)),
+                ('name', models.CharField(max_length=50)),
+                ('issue_limit', models.PositiveIntegerField()),
+            ],
+            options={
+                'db_table': 'membership_tier',
+                'ordering': ['issue_limit'],
+            },
+        ),
+        migrations.RunPython(seed_tiers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.8 on 2026-10-19 06:40
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def normalize_phone(phone):
+    return ''.join(ch for ch in (phone or '') if ch.isdigit()).lstrip('0')
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def backfill_normalized(apps, schema_editor):
+    """Fill the normalized columns, leaving duplicates NULL and reporting them.
+
+    The first reader (by name, then id) keeps the normalized value; later
+    readers sharing it keep NULL so the unique index can be built. Those
+    accounts need merging by staff.
+    """
+    Reader = apps.get_model('library_app', 'Reader')
+    seen = {'phone': {}, 'email': {}}
+    duplicates = defaultdict(list)
+    updates = []
+
+    for reader in Reader.objects.order_by('name', 'library_id').iterator(chunk_size=2000):
+        values = {
+            'phone': normalize_phone(reader.phone),
+            'email': normalize_email(reader.email),
+        }
+        for field, value in values.items():
+            if not value:
+                continue
+            owner = seen[field].get(value)
+            if owner is None:
+                seen[field][value] = reader.library_id
+                setattr(reader, f'{field}_normalized', value)
+            else:
+                duplicates[(field, value)].append(reader.library_id)
+        updates.append(reader)
+
+        if len(updates) >= 2000:
+            Reader.objects.bulk_update(updates, ['phone_normalized', 'email_normalized'])
+            updates = []
+
+    Reader.objects.bulk_update(updates, ['phone_normalized', 'email_normalized'])
+
+    if duplicates:
+        print(f"\n  {len(duplicates)} duplicate reader phone/email values left un-normalized:")
+        for (field, value), reader_ids in sorted(duplicates.items()):
+            kept = seen[field][value]
+            others = ', '.join(str(r) for r in reader_ids)
+            print(f"    {field} {value!r}: kept {kept}, duplicates {others}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0008_membershiptier'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reader',
+            name='reader_branch_phone_idx',
+        ),
+        migrations.AddField(
+            model_name='reader',
+            name='phone_normalized',
+            field=models.CharField(editable=False, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='reader',
+            name='email_normalized',
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(backfill_normalized, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reader',
+            name='phone_normalized',
+            field=models.CharField(editable=False, max_length=20, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='reader',
+            name='email_normalized',
+            field=models.CharField(editable=False, max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill(apps, schema_editor):
+    # The tier a reader had when older loans were made is not recorded
+    # anywhere; their current tier is the best available value
+    Book = apps.get_model('library_app', 'Book')
+    Reader = apps.get_model('library_app', 'Reader')
+    IssueBook = apps.get_model('library_app', 'IssueBook')
+
+    IssueBook.objects.update(
+        category_id=Subquery(
+            Book.objects.filter(pk=OuterRef('book_id')).values('category_id')[:1]
+        ),
+        membership=Subquery(
+            Reader.objects.filter(pk=OuterRef('reader_id')).values('membership')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0009_reader_normalized_contacts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issuebook',
+            name='category',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='issues', to='library_app.category'),
+        ),
+        migrations.AddField(
+            model_name='issuebook',
+            name='membership',
+            field=models.CharField(default='', editable=False, max_length=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='issuebook',
+            name='category',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='issues', to='library_app.category'),
+        ),
+    ]
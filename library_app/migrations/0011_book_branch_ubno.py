@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0010_issuebook_attribution'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='ubno',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(fields=('branch', 'ubno'), name='unique_book_branch_ubno'),
+        ),
+    ]
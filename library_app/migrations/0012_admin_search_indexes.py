@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:51
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0011_book_branch_ubno'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['ubno'], name='book_ubno_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='book_title_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reader',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='reader_name_lower_idx'),
+        ),
+    ]
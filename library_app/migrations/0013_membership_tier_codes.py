@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:52
+
+import library_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0012_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='circulationrollup',
+            name='membership',
+            field=models.CharField(max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='reader',
+            name='membership',
+            field=models.CharField(default='BASIC', max_length=10, validators=[library_app.models.validate_membership]),
+        ),
+    ]
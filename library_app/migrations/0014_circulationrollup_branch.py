@@ -0,0 +1,83 @@
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+
+
+def rebuild(apps, schema_editor):
+    """Recompute every rollup row, per branch, from the loan history.
+
+    Rows written before rollups had a branch cannot be split, and on a
+    database that already had loans when 0006 created the table there are
+    none for the older history, so the whole table is rebuilt. This is the
+    same computation as the backfill_rollups command.
+    """
+    IssueBook = apps.get_model('library_app', 'IssueBook')
+    CirculationRollup = apps.get_model('library_app', 'CirculationRollup')
+
+    dims = ('branch_id', 'category_id', 'membership')
+    loans = IssueBook.objects.order_by()
+    returns = loans.filter(is_returned=True, return_date__isnull=False)
+    counters = defaultdict(lambda: {'loans': 0, 'returns': 0, 'active_readers': 0})
+
+    for period, loan_day, return_day in (
+        ('D', F('issue_date'), F('return_date')),
+        ('M', TruncMonth('issue_date'), TruncMonth('return_date')),
+    ):
+        rows = loans.values(*dims, day=loan_day)
+        for row in rows.annotate(n=Count('id'), readers=Count('reader_id', distinct=True)):
+            key = (period, row['day'], *(row[d] for d in dims))
+            counters[key]['loans'] = row['n']
+            counters[key]['active_readers'] = row['readers']
+
+        rows = returns.values(*dims, day=return_day)
+        for row in rows.annotate(n=Count('id')):
+            counters[(period, row['day'], *(row[d] for d in dims))]['returns'] = row['n']
+
+    CirculationRollup.objects.all().delete()
+    CirculationRollup.objects.bulk_create(
+        [
+            CirculationRollup(
+                period=period,
+                period_start=period_start,
+                branch_id=branch_id,
+                category_id=category_id,
+                membership=membership,
+                **values,
+            )
+            for (period, period_start, branch_id, category_id, membership), values
+            in counters.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_app', '0013_membership_tier_codes'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='circulationrollup',
+            name='unique_circulation_rollup',
+        ),
+        migrations.AddField(
+            model_name='circulationrollup',
+            name='branch',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='rollups', to='library_app.branch'),
+        ),
+        migrations.RunPython(rebuild, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='circulationrollup',
+            name='branch',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='rollups', to='library_app.branch'),
+        ),
+        migrations.AddConstraint(
+            model_name='circulationrollup',
+            constraint=models.UniqueConstraint(fields=('branch', 'period', 'period_start', 'category', 'membership'), name='unique_circulation_rollup'),
+        ),
+    ]
@@ -1,6 +1,42 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Lower
 import uuid
 
+
+# ---------------- BRANCH ----------------
+class Branch(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    code = models.CharField(max_length=10, unique=True)
+
+    class Meta:
+        db_table = 'branch'
+
+    def __str__(self):
+        return self.name
+
+
+class StaffProfile(models.Model):
+    # Binds a staff login to the branch whose data it works on
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='staff_profile'
+    )
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.PROTECT,
+        related_name='staff'
+    )
+
+    class Meta:
+        db_table = 'staff_profile'
+
+    def __str__(self):
+        return f"{self.user} @ {self.branch}"
+
 # ---------------- CATEGORY ----------------
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -14,9 +50,18 @@ class Category(models.Model):
 
 # ---------------- BOOK ----------------
 class Book(models.Model):
+    # Each branch holds its own stock record; composite indexes below
+    # lead with branch, so the plain FK index is not needed
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.PROTECT,
+        related_name='books',
+        db_index=False
+    )
     title = models.CharField(max_length=200)
     author = models.CharField(max_length=200)
-    ubno = models.CharField(max_length=50, unique=True)
+    # Unique within a branch; each branch keeps its own stock of a title
+    ubno = models.CharField(max_length=50)
     category = models.ForeignKey(
         Category,
         on_delete=models.CASCADE,
@@ -27,6 +72,19 @@ class Book(models.Model):
 
     class Meta:
         db_table = 'book'
+        indexes = [
+            models.Index(fields=['branch', 'title'], name='book_branch_title_idx'),
+            models.Index(fields=['branch', 'category'], name='book_branch_category_idx'),
+            # Admin search: ubno across branches, case-insensitive title prefix
+            models.Index(fields=['ubno'], name='book_ubno_idx'),
+            models.Index(Lower('title'), name='book_title_lower_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['branch', 'ubno'],
+                name='unique_book_branch_ubno'
+            )
+        ]
 
     def save(self, *args, **kwargs):
         # 🔒 Ensure valid available copies
@@ -40,45 +98,181 @@ class Book(models.Model):
         return self.title
 
 
+# ---------------- MEMBERSHIP TIER ----------------
+# The tier list lives in the shared cache, so a tier added or changed in
+# the admin is seen by every worker on its next request; the TTL only
+# covers writes that bypass save()/delete()
+TIER_CACHE_KEY = 'membership_tiers'
+TIER_CACHE_SECONDS = 300
+
+
+class MembershipTier(models.Model):
+    code = models.CharField(max_length=10, unique=True)
+    name = models.CharField(max_length=50)
+    issue_limit = models.PositiveIntegerField()
+
+    class Meta:
+        db_table = 'membership_tier'
+        ordering = ['issue_limit']
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        MembershipTier.clear_cache()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        MembershipTier.clear_cache()
+        return result
+
+    @staticmethod
+    def clear_cache():
+        cache.delete(TIER_CACHE_KEY)
+
+    @classmethod
+    def _cached(cls):
+        tiers = cache.get(TIER_CACHE_KEY)
+        if tiers is None:
+            tiers = list(cls.objects.values_list('code', 'name', 'issue_limit'))
+            cache.set(TIER_CACHE_KEY, tiers, TIER_CACHE_SECONDS)
+        return tiers
+
+    @classmethod
+    def limits(cls):
+        """{code: issue_limit} for every tier."""
+        return {code: limit for code, _, limit in cls._cached()}
+
+    @classmethod
+    def choices(cls):
+        """(code, name) pairs for forms, ordered by issue limit."""
+        return [(code, name) for code, name, _ in cls._cached()]
+
+    def __str__(self):
+        return f"{self.name} ({self.issue_limit})"
+
+
+def validate_membership(code):
+    if code not in MembershipTier.limits():
+        raise ValidationError(f"Unknown membership tier '{code}'")
+
+
 # ---------------- READER ----------------
-class Reader(models.Model):
+def normalize_phone(phone):
+    # Digits only, without the 0/00 dialling prefixes, so "098765 43210"
+    # and "98765-43210" are the same number
+    return ''.join(ch for ch in (phone or '') if ch.isdigit()).lstrip('0')
 
-    MEMBERSHIP_CHOICES = [
-        ('BASIC', 'Basic'),
-        ('PREMIUM', 'Premium'),
-        ('VIP', 'VIP'),
-    ]
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+class Reader(models.Model):
 
     library_id = models.UUIDField(
         default=uuid.uuid4,
         primary_key=True,
         editable=False
     )
+    # Home branch of the member
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.PROTECT,
+        related_name='readers',
+        db_index=False
+    )
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=13)
     email = models.EmailField(max_length=100)
     address = models.CharField(max_length=150)
 
+    # Filled in save(); the unique indexes catch duplicates that only
+    # differ in formatting or case. NULL only for pre-existing duplicates
+    # left behind by the backfill migration.
+    phone_normalized = models.CharField(
+        max_length=20,
+        unique=True,
+        null=True,
+        editable=False
+    )
+    email_normalized = models.CharField(
+        max_length=100,
+        unique=True,
+        null=True,
+        editable=False
+    )
+
+    # A MembershipTier code; the tiers are data, so they are checked by
+    # the validator rather than listed as choices
     membership = models.CharField(
         max_length=10,
-        choices=MEMBERSHIP_CHOICES,
-        default='BASIC'
+        default='BASIC',
+        validators=[validate_membership]
     )
 
     issue_limit = models.PositiveIntegerField(default=3)
 
     class Meta:
         db_table = 'reader'
+        indexes = [
+            models.Index(fields=['branch', 'name'], name='reader_branch_name_idx'),
+            # Admin search by case-insensitive name prefix
+            models.Index(Lower('name'), name='reader_name_lower_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        reader = super().from_db(db, field_names, values)
+        reader._loaded_contacts = (reader.__dict__.get('phone'), reader.__dict__.get('email'))
+        return reader
+
+    def _changed_contacts(self):
+        # {normalized field: value} for the contacts that are new or were
+        # edited since loading; an untouched contact keeps its stored
+        # value, which stays NULL for a duplicate left by the backfill
+        loaded = getattr(self, '_loaded_contacts', None)
+        if self._state.adding or loaded is None:
+            loaded = (object(), object())
+        changed = {}
+        for source, normalize, old in (
+            ('phone', normalize_phone, loaded[0]),
+            ('email', normalize_email, loaded[1]),
+        ):
+            # A deferred field that was never read cannot have changed
+            if source in self.__dict__ and self.__dict__[source] != old:
+                changed[f'{source}_normalized'] = normalize(self.__dict__[source]) or None
+        return changed
+
+    def validate_unique(self, exclude=None):
+        # The normalized columns are not editable, so ModelForm skips
+        # them; check them here so the admin shows a form error
+        errors = {}
+        try:
+            super().validate_unique(exclude=exclude)
+        except ValidationError as e:
+            errors = e.update_error_dict(errors)
+
+        exclude = exclude or set()
+        for field, value in self._changed_contacts().items():
+            source = field.removesuffix('_normalized')
+            if value is None or source in exclude or source in errors:
+                continue
+            taken = Reader.objects.filter(**{field: value}).exclude(pk=self.pk).exists()
+            if taken:
+                label = 'Phone number' if source == 'phone' else 'Email'
+                errors[source] = [ValidationError(f"{label} already exists")]
+
+        if errors:
+            raise ValidationError(errors)
 
     def save(self, *args, **kwargs):
-        # 🔒 Auto set issue limit based on membership
-        if self.membership == 'BASIC':
-            self.issue_limit = 3
-        elif self.membership == 'PREMIUM':
-            self.issue_limit = 5
-        elif self.membership == 'VIP':
-            self.issue_limit = 10
+        # 🔒 Auto set issue limit based on membership tier policy
+        limit = MembershipTier.limits().get(self.membership)
+        if limit is not None:
+            self.issue_limit = limit
+        for field, value in self._changed_contacts().items():
+            setattr(self, field, value)
         super().save(*args, **kwargs)
+        self._loaded_contacts = (self.phone, self.email)
 
     def __str__(self):
         return self.name
@@ -86,6 +280,13 @@ class Reader(models.Model):
 
 # ---------------- ISSUE BOOK ----------------
 class IssueBook(models.Model):
+    # Branch the loan was issued at (same as the book's branch)
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.PROTECT,
+        related_name='issues',
+        db_index=False
+    )
     book = models.ForeignKey(
         Book,
         on_delete=models.CASCADE,
@@ -96,6 +297,15 @@ class IssueBook(models.Model):
         on_delete=models.CASCADE,
         related_name='issued_books'
     )
+    # Copied from the book and reader when the loan is made, so rollups
+    # keep counting it where it was counted after a re-tier or an edit
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='issues',
+        editable=False
+    )
+    membership = models.CharField(max_length=10, editable=False)
     issue_date = models.DateField(auto_now_add=True)
     return_date = models.DateField(null=True, blank=True)
     is_returned = models.BooleanField(default=False)
@@ -103,6 +313,13 @@ class IssueBook(models.Model):
     class Meta:
         db_table = 'issueBook'
         ordering = ['-issue_date']
+        indexes = [
+            models.Index(
+                fields=['branch', 'is_returned', 'reader'],
+                name='issue_branch_open_reader_idx'
+            ),
+            models.Index(fields=['branch', 'issue_date'], name='issue_branch_date_idx'),
+        ]
         constraints = [
             # 🚫 Prevent issuing same book twice without return
             models.UniqueConstraint(
@@ -111,5 +328,97 @@ class IssueBook(models.Model):
             )
         ]
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            if self.category_id is None:
+                self.category_id = self.book.category_id
+            if not self.membership:
+                self.membership = self.reader.membership
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.book.title} → {self.reader.name}"
+
+
+# ---------------- BOOK RECOMMENDATION ----------------
+class BookRecommendation(models.Model):
+    # Precomputed "readers who borrowed this also borrowed" neighbours.
+    # Rows are rebuilt by the build_recommendations command, never live.
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='recommendations'
+    )
+    recommended = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    # Number of readers who borrowed both books (0 = category fallback)
+    score = models.PositiveIntegerField(default=0)
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        db_table = 'book_recommendation'
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['book', 'recommended'],
+                name='unique_book_recommendation'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} → {self.recommended_id} (#{self.rank})"
+
+
+# ---------------- CIRCULATION ROLLUP ----------------
+class CirculationRollup(models.Model):
+    # Pre-aggregated loan/return counts for trend reports. Maintained
+    # incrementally by issue_book/return_book, rebuilt by backfill_rollups.
+
+    DAILY = 'D'
+    MONTHLY = 'M'
+    PERIOD_CHOICES = [
+        (DAILY, 'Daily'),
+        (MONTHLY, 'Monthly'),
+    ]
+
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    # Branch of the loans; the unique constraint leads with it, so the
+    # plain FK index is not needed
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.PROTECT,
+        related_name='rollups',
+        db_index=False
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name='rollups'
+    )
+    # Tier code as stored on the loans, kept even if the tier is removed
+    membership = models.CharField(max_length=10)
+
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    # Distinct readers who borrowed in this period
+    active_readers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'circulation_rollup'
+        ordering = ['period', 'period_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['branch', 'period', 'period_start', 'category', 'membership'],
+                name='unique_circulation_rollup'
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.get_period_display()} {self.period_start} "
+            f"{self.branch_id}/{self.category_id}/{self.membership}"
+        )
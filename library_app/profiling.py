@@ -0,0 +1,215 @@
+"""
+Opt-in request profiler.
+
+When enabled (PROFILING_ENABLED setting, or `manage.py profiling on`),
+ProfilingMiddleware runs a stack sampler next to each request and times
+every SQL query. Requests picked by PROFILING_SAMPLE_RATE, or slower than
+PROFILING_SLOW_MS, are written to PROFILING_DIR as:
+
+  <id>.folded  collapsed stacks ("a;b;c 12"), the input format of
+               flamegraph.pl and speedscope
+  <id>.json    timing, status, view name and SQL breakdown
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+
+FLAG_FILE = 'ENABLED'
+FLAG_CHECK_SECONDS = 2.0
+TOP_QUERIES = 10
+
+_flag_cache = {'checked': 0.0, 'enabled': False}
+
+
+def profiling_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def set_enabled(enabled):
+    """Turn profiling on/off for all workers sharing PROFILING_DIR."""
+    flag = profiling_dir() / FLAG_FILE
+    if enabled:
+        flag.parent.mkdir(parents=True, exist_ok=True)
+        flag.touch()
+    elif flag.exists():
+        flag.unlink()
+    _flag_cache['checked'] = 0.0
+
+
+def is_enabled():
+    if settings.PROFILING_ENABLED:
+        return True
+
+    # The flag file is re-checked every couple of seconds rather than on
+    # every request
+    now = time.monotonic()
+    if now - _flag_cache['checked'] > FLAG_CHECK_SECONDS:
+        _flag_cache['enabled'] = (profiling_dir() / FLAG_FILE).exists()
+        _flag_cache['checked'] = now
+    return _flag_cache['enabled']
+
+
+# ---------------- STACK SAMPLER ----------------
+class StackSampler:
+    """Samples the stack of one thread at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self):
+        return ''.join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+# ---------------- SQL TIMER ----------------
+class QueryTimer:
+    """execute_wrapper that records time spent per SQL statement."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.by_sql = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.total += elapsed
+            entry = self.by_sql.setdefault(sql, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def summary(self):
+        top = sorted(self.by_sql.items(), key=lambda item: -item[1][1])
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 2),
+            'top': [
+                {'sql': sql, 'count': n, 'total_ms': round(t * 1000, 2)}
+                for sql, (n, t) in top[:TOP_QUERIES]
+            ],
+        }
+
+
+# ---------------- MIDDLEWARE ----------------
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_enabled():
+            return self.get_response(request)
+
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        sampler = StackSampler(
+            threading.get_ident(),
+            settings.PROFILING_INTERVAL_MS / 1000
+        )
+        timer = QueryTimer()
+
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            with connections['default'].execute_wrapper(timer):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if sampled or elapsed_ms >= settings.PROFILING_SLOW_MS:
+            save_capture(request, response, elapsed_ms, sampler, timer)
+
+        return response
+
+
+# ---------------- CAPTURES ----------------
+def save_capture(request, response, elapsed_ms, sampler, timer):
+    directory = profiling_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    match = request.resolver_match
+    view = match.view_name if match else ''
+    capture_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.randrange(16 ** 6):06x}"
+
+    (directory / f"{capture_id}.folded").write_text(sampler.collapsed())
+    (directory / f"{capture_id}.json").write_text(json.dumps({
+        'id': capture_id,
+        'timestamp': time.time(),
+        'method': request.method,
+        'path': request.path,
+        'view': view,
+        'status': response.status_code,
+        'duration_ms': round(elapsed_ms, 2),
+        'samples': sum(sampler.stacks.values()),
+        'sql': timer.summary(),
+    }, indent=2))
+
+    _prune(directory)
+
+
+def _prune(directory):
+    keep = settings.PROFILING_KEEP
+    captures = sorted(directory.glob('*.json'), key=lambda p: p.stat().st_mtime)
+    for old in captures[:-keep] if keep else captures:
+        old.unlink(missing_ok=True)
+        old.with_suffix('.folded').unlink(missing_ok=True)
+
+
+def list_captures(limit=50):
+    """Captured requests, slowest first."""
+    captures = []
+    for path in profiling_dir().glob('*.json'):
+        try:
+            captures.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            # Half-written or pruned by another worker
+            continue
+    captures.sort(key=lambda c: -c['duration_ms'])
+    return captures[:limit]
+
+
+def capture_file(capture_id, suffix):
+    """Path of a capture file, or None for unknown/unsafe ids."""
+    if not capture_id or os.path.basename(capture_id) != capture_id:
+        return None
+    path = profiling_dir() / f"{capture_id}{suffix}"
+    return path if path.is_file() else None
@@ -0,0 +1,200 @@
+"""
+"Readers who borrowed this also borrowed" recommendations.
+
+The batch side (build_recommendations) scans IssueBook history and stores
+the top-K co-borrowed books per book in BookRecommendation. The request
+side (suggestions_for_reader) only reads those rows with a single query.
+"""
+
+from collections import Counter, defaultdict
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Book, BookRecommendation, IssueBook
+
+
+DEFAULT_TOP_K = 10
+DEFAULT_SHARD_SIZE = 5000
+DEFAULT_MAX_BASKET = 200
+DEFAULT_CHUNK_SIZE = 5000
+
+
+# ---------------- BATCH BUILD ----------------
+def _reader_baskets(chunk_size):
+    """Yield the set of distinct book ids borrowed by each reader.
+
+    Loans are streamed ordered by reader, so only one reader's basket is
+    held in memory at a time.
+    """
+    rows = (
+        IssueBook.objects
+        .order_by('reader_id', 'book_id')
+        .values_list('reader_id', 'book_id')
+        .distinct()
+        .iterator(chunk_size=chunk_size)
+    )
+    for _, group in groupby(rows, key=lambda row: row[0]):
+        yield {book_id for _, book_id in group}
+
+
+def _category_popularity(book_shelf, top_k, chunk_size):
+    """Most borrowed books per (branch, category), used to pad short neighbour lists.
+
+    Book rows are per-branch stock, so the fallback for a book only ranks
+    books of its own branch; suggestions are filtered to the reader's branch.
+    """
+    # Counted by the database, one row per borrowed book
+    rows = (
+        IssueBook.objects
+        .order_by()
+        .values('book_id')
+        .annotate(loans=Count('id'))
+        .values_list('book_id', 'loans')
+        .iterator(chunk_size=chunk_size)
+    )
+    loans = Counter(dict(rows))
+
+    per_shelf = defaultdict(list)
+    for book_id, shelf in book_shelf.items():
+        per_shelf[shelf].append(book_id)
+
+    popular = {}
+    for shelf, book_ids in per_shelf.items():
+        book_ids.sort(key=lambda b: (-loans[b], b))
+        # One extra so a book can still get K fallbacks after excluding itself
+        popular[shelf] = book_ids[:top_k + 1]
+    return popular
+
+
+def _top_neighbours(book_id, counts, category_books, top_k):
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    neighbours = ranked[:top_k]
+
+    if len(neighbours) < top_k:
+        seen = {b for b, _ in neighbours}
+        seen.add(book_id)
+        for other in category_books:
+            if other not in seen:
+                neighbours.append((other, 0))
+                seen.add(other)
+            if len(neighbours) >= top_k:
+                break
+
+    return neighbours
+
+
+def build_recommendations(
+    top_k=DEFAULT_TOP_K,
+    shard_size=DEFAULT_SHARD_SIZE,
+    max_basket=DEFAULT_MAX_BASKET,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    log=None,
+):
+    """Rebuild BookRecommendation from the full loan history.
+
+    Co-occurrence counts are kept as a sparse {book: Counter} map, but only
+    for the source books of the current shard, so peak memory is bounded by
+    ``shard_size`` books and their neighbours rather than by the catalogue
+    or the number of loans. Each shard costs one streamed pass over loans.
+    Baskets larger than ``max_basket`` (bulk/test accounts) are skipped to
+    keep the per-reader work bounded.
+
+    Returns the number of recommendation rows written.
+    """
+    # {book id: (branch id, category id)}
+    book_shelf = {
+        book_id: (branch_id, category_id)
+        for book_id, branch_id, category_id in Book.objects.values_list(
+            'id', 'branch_id', 'category_id'
+        ).iterator(chunk_size=chunk_size)
+    }
+    if not book_shelf:
+        BookRecommendation.objects.all().delete()
+        return 0
+
+    popular = _category_popularity(book_shelf, top_k, chunk_size)
+    all_ids = sorted(book_shelf)
+    written = 0
+
+    for start in range(0, len(all_ids), shard_size):
+        shard = all_ids[start:start + shard_size]
+        low, high = shard[0], shard[-1]
+        counts = defaultdict(Counter)
+
+        for basket in _reader_baskets(chunk_size):
+            if len(basket) < 2 or len(basket) > max_basket:
+                continue
+            for book_id in basket:
+                if low <= book_id <= high:
+                    row = counts[book_id]
+                    for other in basket:
+                        if other != book_id:
+                            row[other] += 1
+
+        rows = []
+        for book_id in shard:
+            neighbours = _top_neighbours(
+                book_id,
+                counts.get(book_id, {}),
+                popular.get(book_shelf[book_id], []),
+                top_k,
+            )
+            rows.extend(
+                BookRecommendation(
+                    book_id=book_id,
+                    recommended_id=other,
+                    score=score,
+                    rank=rank,
+                )
+                for rank, (other, score) in enumerate(neighbours, start=1)
+            )
+
+        with transaction.atomic():
+            BookRecommendation.objects.filter(
+                book_id__gte=low, book_id__lte=high
+            ).delete()
+            BookRecommendation.objects.bulk_create(rows, batch_size=1000)
+
+        written += len(rows)
+        if log:
+            log(f"Books {low}-{high}: {len(rows)} recommendations")
+
+    return written
+
+
+# ---------------- REQUEST PATH ----------------
+def suggestions_for_reader(reader, limit=5, available_only=False, branch=None):
+    """Suggested books for a reader, from precomputed neighbours only.
+
+    Runs a single query: neighbours of every book the reader has borrowed,
+    minus the books they already borrowed, optionally limited to the stock
+    of one branch.
+    """
+    borrowed = IssueBook.objects.filter(reader=reader).values('book_id')
+
+    qs = (
+        BookRecommendation.objects
+        .filter(book_id__in=borrowed)
+        .exclude(recommended_id__in=borrowed)
+        .select_related('recommended')
+        .order_by('rank', '-score')
+    )
+    if available_only:
+        qs = qs.filter(recommended__available_copies__gt=0)
+    if branch is not None:
+        qs = qs.filter(recommended__branch=branch)
+
+    suggestions = []
+    seen = set()
+    # A book can be a neighbour of several borrowed books; over-fetch a
+    # little and de-duplicate here instead of a GROUP BY.
+    for rec in qs[:limit * 4]:
+        if rec.recommended_id in seen:
+            continue
+        seen.add(rec.recommended_id)
+        suggestions.append(rec.recommended)
+        if len(suggestions) >= limit:
+            break
+    return suggestions
@@ -0,0 +1,285 @@
+"""
+Daily and monthly circulation rollups per branch, category and membership
+tier.
+
+issue_book and return_book call record_issue/record_return inside their
+transactions, so CirculationRollup stays current without ever scanning
+IssueBook. compute_rollups recomputes the same numbers from raw loans and
+is shared by the backfill and verify commands.
+
+Both paths attribute a loan, and its return, to the branch it was issued
+at and the category and membership stored on the IssueBook row, so re-tiering
+readers or moving a book to another category does not make the verifier
+report drift. trend() reads the stored rows for the circulation report.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import CirculationRollup, IssueBook
+
+
+COUNTERS = ('loans', 'returns', 'active_readers')
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _whole_months(start, end):
+    # Monthly rows cover whole months, so widen ranges to month boundaries
+    if start:
+        start = _month_start(start)
+    if end:
+        end = _next_month(end) - timedelta(days=1)
+    return start, end
+
+
+def _period_range(period, day):
+    if period == CirculationRollup.DAILY:
+        return day, day
+    start = _month_start(day)
+    return start, _next_month(start) - timedelta(days=1)
+
+
+def _bump(period, day, issue, **deltas):
+    period_start = day if period == CirculationRollup.DAILY else _month_start(day)
+    key = {
+        'period': period,
+        'period_start': period_start,
+        'branch_id': issue.branch_id,
+        'category_id': issue.category_id,
+        'membership': issue.membership,
+    }
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+
+    if CirculationRollup.objects.filter(**key).update(**changes):
+        return
+
+    try:
+        # Savepoint so a concurrent insert of the same row doesn't poison
+        # the caller's transaction
+        with transaction.atomic():
+            CirculationRollup.objects.create(**key, **deltas)
+    except IntegrityError:
+        CirculationRollup.objects.filter(**key).update(**changes)
+
+
+# ---------------- INCREMENTAL ----------------
+def record_issue(issue):
+    """Count a new loan. Call inside the transaction that created it."""
+    for period in (CirculationRollup.DAILY, CirculationRollup.MONTHLY):
+        start, end = _period_range(period, issue.issue_date)
+        # Narrowed by the reader FK index, so this stays a short lookup
+        first_loan = not IssueBook.objects.filter(
+            reader_id=issue.reader_id,
+            branch_id=issue.branch_id,
+            category_id=issue.category_id,
+            membership=issue.membership,
+            issue_date__range=(start, end),
+        ).exclude(id=issue.id).exists()
+
+        _bump(
+            period, issue.issue_date, issue,
+            loans=1, active_readers=int(first_loan),
+        )
+
+
+def record_return(issue):
+    """Count a return. Call inside the transaction that marked it returned."""
+    for period in (CirculationRollup.DAILY, CirculationRollup.MONTHLY):
+        _bump(period, issue.return_date, issue, returns=1)
+
+
+# ---------------- RECOMPUTE ----------------
+def compute_rollups(start=None, end=None):
+    """Recompute rollup counters from IssueBook.
+
+    Returns {(period, period_start, branch_id, category_id, membership):
+    {counter: n}}
+    for periods in [start, end], widened to whole months.
+    """
+    start, end = _whole_months(start, end)
+    result = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    loans = IssueBook.objects.all()
+    returns = IssueBook.objects.filter(is_returned=True, return_date__isnull=False)
+    if start:
+        loans = loans.filter(issue_date__gte=start)
+        returns = returns.filter(return_date__gte=start)
+    if end:
+        loans = loans.filter(issue_date__lte=end)
+        returns = returns.filter(return_date__lte=end)
+
+    dims = ('branch_id', 'category_id', 'membership')
+    grouped = {
+        CirculationRollup.DAILY: {
+            'loans': loans.values('issue_date', *dims),
+            'returns': returns.values('return_date', *dims),
+        },
+        CirculationRollup.MONTHLY: {
+            'loans': loans.annotate(
+                month=TruncMonth('issue_date')
+            ).values('month', *dims),
+            'returns': returns.annotate(
+                month=TruncMonth('return_date')
+            ).values('month', *dims),
+        },
+    }
+
+    for period, queries in grouped.items():
+        date_key = 'issue_date' if period == CirculationRollup.DAILY else 'month'
+        rows = queries['loans'].annotate(
+            n=Count('id'),
+            readers=Count('reader_id', distinct=True),
+        ).order_by()
+        for row in rows:
+            counters = result[(
+                period, row[date_key],
+                row['branch_id'], row['category_id'], row['membership'],
+            )]
+            counters['loans'] = row['n']
+            counters['active_readers'] = row['readers']
+
+        date_key = 'return_date' if period == CirculationRollup.DAILY else 'month'
+        rows = queries['returns'].annotate(n=Count('id')).order_by()
+        for row in rows:
+            result[(
+                period, row[date_key],
+                row['branch_id'], row['category_id'], row['membership'],
+            )]['returns'] = row['n']
+
+    return dict(result)
+
+
+def stored_rollups(start=None, end=None):
+    """Current CirculationRollup rows in the same shape as compute_rollups."""
+    start, end = _whole_months(start, end)
+    rows = CirculationRollup.objects.all()
+    if start:
+        rows = rows.filter(period_start__gte=start)
+    if end:
+        rows = rows.filter(period_start__lte=end)
+
+    return {
+        (r.period, r.period_start, r.branch_id, r.category_id, r.membership): {
+            field: getattr(r, field) for field in COUNTERS
+        }
+        for r in rows
+    }
+
+
+def diff_rollups(start=None, end=None):
+    """List (key, stored, expected) for every rollup row that disagrees."""
+    expected = compute_rollups(start, end)
+    stored = stored_rollups(start, end)
+    empty = dict.fromkeys(COUNTERS, 0)
+
+    diffs = []
+    for key in sorted(set(expected) | set(stored), key=str):
+        have = stored.get(key, empty)
+        want = expected.get(key, empty)
+        if have != want:
+            diffs.append((key, have, want))
+    return diffs
+
+
+def rebuild_rollups(start=None, end=None):
+    """Replace stored rollups in [start, end] with freshly computed ones."""
+    start, end = _whole_months(start, end)
+    computed = compute_rollups(start, end)
+
+    with transaction.atomic():
+        stale = CirculationRollup.objects.all()
+        if start:
+            stale = stale.filter(period_start__gte=start)
+        if end:
+            stale = stale.filter(period_start__lte=end)
+        stale.delete()
+
+        CirculationRollup.objects.bulk_create(
+            [
+                CirculationRollup(
+                    period=period,
+                    period_start=period_start,
+                    branch_id=branch_id,
+                    category_id=category_id,
+                    membership=membership,
+                    **counters,
+                )
+                for (period, period_start, branch_id, category_id, membership), counters
+                in computed.items()
+            ],
+            batch_size=1000,
+        )
+
+    return len(computed)
+
+
+# ---------------- REPORTING ----------------
+REPORT_DAYS = 30
+REPORT_MONTHS = 12
+
+
+def report_start(period, today):
+    """First period shown by the circulation report ending at ``today``."""
+    if period == CirculationRollup.DAILY:
+        return today - timedelta(days=REPORT_DAYS - 1)
+    start = _month_start(today)
+    for _ in range(REPORT_MONTHS - 1):
+        start = _month_start(start - timedelta(days=1))
+    return start
+
+
+def trend(period=CirculationRollup.MONTHLY, start=None, end=None, by='category',
+          branch=None):
+    """Totals per period and per category or membership, for charts.
+
+    Limited to one branch when ``branch`` is given, otherwise summed over
+    every branch.
+
+    Each row has period_start, label (category name or membership code),
+    loans, returns and active_readers. active_readers is summed over the
+    rows grouped together, so a reader borrowing from two categories counts
+    twice when grouping by membership.
+    """
+    rows = CirculationRollup.objects.filter(period=period)
+    if branch is not None:
+        rows = rows.filter(branch=branch)
+    if start:
+        rows = rows.filter(period_start__gte=start)
+    if end:
+        rows = rows.filter(period_start__lte=end)
+
+    dimension = 'category__name' if by == 'category' else 'membership'
+    return rows.values('period_start', label=F(dimension)).annotate(
+        loans=Sum('loans'),
+        returns=Sum('returns'),
+        active_readers=Sum('active_readers'),
+    ).order_by('period_start', 'label')
+
+
+def trend_totals(rows):
+    """Per-period loan/return totals of trend() rows, with the loans as a
+    percentage of the busiest period for drawing bars."""
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(
+            row['period_start'],
+            {'period_start': row['period_start'], 'loans': 0, 'returns': 0},
+        )
+        total['loans'] += row['loans']
+        total['returns'] += row['returns']
+
+    busiest = max((t['loans'] for t in totals.values()), default=0)
+    for total in totals.values():
+        total['percent'] = round(100 * total['loans'] / busiest) if busiest else 0
+    return list(totals.values())
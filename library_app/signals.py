@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth_backends import user_cache_key
+from .branches import forget_staff_branch, invalidate_staff_branches
+from .models import Branch, StaffProfile
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def drop_cached_user(sender, instance, **kwargs):
+    cache.delete(user_cache_key(instance.pk))
+    forget_staff_branch(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=StaffProfile)
+@receiver([post_save, post_delete], sender=Branch)
+def drop_cached_branches(sender, instance, **kwargs):
+    invalidate_staff_branches()
@@ -1,3 +1,1132 @@
-from django.test import TestCase
+import hmac
+import io
+import json
+import sqlite3
+import threading
+import tempfile
+import time
+from importlib import import_module
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.db import connection
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, get_resolver
+
+from .admin import EstimatedCountPaginator, LargeTableAdmin
+from .auth_backends import user_cache_key
+from .backups import (
+    BackupError, WriteProbe, copy_database, create_snapshot, list_snapshots, restore_snapshot,
+)
+from .branches import GENERATION_KEY, staff_branch
+from .models import (
+    Branch, StaffProfile, Category, Book, MembershipTier, Reader, IssueBook,
+    BookRecommendation, CirculationRollup, normalize_phone,
+)
+from .profiling import StackSampler, capture_file, is_enabled, set_enabled
+from .recommendations import build_recommendations, suggestions_for_reader
+from .rollups import diff_rollups
+from .tiers import _pk_chunks, retier
+from .warmup import warm_connections, warm_templates, warm_urls
+
+
+# Test rows reuse primary keys, so keep them out of the shared file cache
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AdminChangelistQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.branch = Branch.objects.get(code='MAIN')
+        cls.category = Category.objects.create(name='Fiction')
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def add_loans(self, start, count):
+        for i in range(start, start + count):
+            book = Book.objects.create(
+                branch=self.branch,
+                title=f'Book {i}',
+                author='Author',
+                ubno=f'UB{i}',
+                category=self.category,
+            )
+            reader = Reader.objects.create(
+                branch=self.branch,
+                name=f'Reader {i}',
+                phone=f'90000{i:05d}',
+                email=f'reader{i}@example.com',
+                address='Street',
+            )
+            IssueBook.objects.create(branch=self.branch, book=book, reader=reader)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assert_constant_queries(self, url):
+        self.add_loans(0, 2)
+        # Prime the session/user cache so both counts are warm
+        self.client.get(url)
+        few = self.count_queries(url)
+        self.add_loans(2, 20)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+    def test_book_changelist(self):
+        self.assert_constant_queries('/admin/library_app/book/')
+
+    def test_reader_changelist(self):
+        self.assert_constant_queries('/admin/library_app/reader/')
+
+    def test_issuebook_changelist(self):
+        self.assert_constant_queries('/admin/library_app/issuebook/')
+
+    def test_issuebook_search(self):
+        self.assert_constant_queries('/admin/library_app/issuebook/?q=Reader')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReaderContactUniquenessTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('desk', 'desk@example.com', 'pw', is_staff=True)
+        cls.branch = Branch.objects.get(code='MAIN')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def add_reader(self, phone, email):
+        response = self.client.post('/add_reader/', {
+            'reader_name': 'Asha',
+            'number': phone,
+            'email': email,
+            'address': 'Street',
+        }, follow=True)
+        return [str(m) for m in response.context['messages']]
+
+    def test_normalize_phone(self):
+        self.assertEqual(normalize_phone('098765 43210'), '9876543210')
+        self.assertEqual(normalize_phone('98765-43210'), '9876543210')
+
+    def test_duplicate_phone_differing_in_format(self):
+        self.add_reader('9876543210', 'a@example.com')
+        messages = self.add_reader('98765-43210', 'b@example.com')
+        self.assertEqual(messages, ["Phone number already exists"])
+        self.assertEqual(Reader.objects.count(), 1)
+
+    def test_duplicate_email_differing_in_case(self):
+        self.add_reader('9876543210', 'asha@example.com')
+        messages = self.add_reader('9123456780', 'Asha@Example.com')
+        self.assertEqual(messages, ["Email already exists"])
+        self.assertEqual(Reader.objects.count(), 1)
+
+    def test_single_insert_on_create(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post('/add_reader/', {
+                'reader_name': 'Asha',
+                'number': '9876543210',
+                'email': 'asha@example.com',
+                'address': 'Street',
+            })
+        reader_queries = [q['sql'] for q in ctx.captured_queries if '"reader"' in q['sql']]
+        self.assertEqual(len(reader_queries), 1)
+        self.assertTrue(reader_queries[0].startswith('INSERT'))
+
+    def test_return_book_finds_reader_by_formatted_phone(self):
+        self.add_reader('9876543210', 'asha@example.com')
+        response = self.client.get('/return-book/', {'reader_key': '98765 43210'})
+        self.assertEqual(response.context['reader'].email, 'asha@example.com')
+
+    def legacy_duplicate(self):
+        # As the 0009 backfill leaves it: a formatting variant of another
+        # reader's phone, with the normalized column left NULL
+        Reader.objects.create(
+            branch=self.branch, name='Asha', phone='9876543210',
+            email='asha@example.com', address='Street',
+        )
+        duplicate = Reader.objects.create(
+            branch=self.branch, name='Asha B', phone='9000000000',
+            email='ashab@example.com', address='Street',
+        )
+        Reader.objects.filter(pk=duplicate.pk).update(
+            phone='98765-43210', phone_normalized=None
+        )
+        return Reader.objects.get(pk=duplicate.pk)
+
+    def test_legacy_duplicate_can_be_saved(self):
+        duplicate = self.legacy_duplicate()
+        response = self.client.post(
+            f'/change-membership/{duplicate.library_id}/', {'membership': 'PREMIUM'}
+        )
+        self.assertEqual(response.status_code, 302)
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.membership, 'PREMIUM')
+        self.assertIsNone(duplicate.phone_normalized)
+        self.assertEqual(duplicate.email_normalized, 'ashab@example.com')
+
+    def test_legacy_duplicate_normalized_once_contact_changes(self):
+        duplicate = self.legacy_duplicate()
+        duplicate.phone = '9111111111'
+        duplicate.save()
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.phone_normalized, '9111111111')
+
+    def test_admin_rejects_formatting_variant(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        Reader.objects.create(
+            branch=self.branch, name='Asha', phone='9876543210',
+            email='asha@example.com', address='Street',
+        )
+        other = Reader.objects.create(
+            branch=self.branch, name='Ravi', phone='9123456780',
+            email='ravi@example.com', address='Street',
+        )
+        response = self.client.post(f'/admin/library_app/reader/{other.pk}/change/', {
+            'branch': self.branch.pk,
+            'name': 'Ravi',
+            'phone': '98765-43210',
+            'email': 'Asha@Example.com',
+            'address': 'Street',
+            'membership': 'BASIC',
+            'issue_limit': 3,
+        })
+        self.assertEqual(response.status_code, 200)
+        errors = response.context['adminform'].form.errors
+        self.assertEqual(errors['phone'], ["Phone number already exists"])
+        self.assertEqual(errors['email'], ["Email already exists"])
+        other.refresh_from_db()
+        self.assertEqual(other.phone, '9123456780')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class EstimatedCountPaginatorTests(TestCase):
+
+    def setUp(self):
+        branch = Branch.objects.get(code='MAIN')
+        category = Category.objects.create(name='Fiction')
+        for i in range(5):
+            Book.objects.create(
+                branch=branch, title=f'Book {i}', author='A',
+                ubno=f'UB{i}', category=category,
+            )
+
+    def test_unfiltered_uses_estimate(self):
+        class Paginator(EstimatedCountPaginator):
+            ESTIMATE_THRESHOLD = 1
+
+        paginator = Paginator(Book.objects.order_by('pk'), 2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(paginator.count, Book.objects.order_by('-pk').first().pk)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+
+    def test_filtered_counts_exactly(self):
+        class Paginator(EstimatedCountPaginator):
+            ESTIMATE_THRESHOLD = 1
+
+        paginator = Paginator(Book.objects.filter(title__startswith='Book').order_by('pk'), 2)
+        self.assertEqual(paginator.count, 5)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CachedAuthTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def test_user_read_from_cache_after_first_request(self):
+        self.client.get('/issue_book/')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/issue_book/')
+        tables = ('"auth_user"', '"django_session"', '"staff_profile"')
+        self.assertFalse([q for q in ctx.captured_queries if any(t in q['sql'] for t in tables)])
+
+    def test_deactivated_user_logged_out_immediately(self):
+        self.client.get('/issue_book/')
+        self.assertIsNotNone(cache.get(user_cache_key(self.staff.pk)))
+
+        self.staff.is_active = False
+        self.staff.save()
+        response = self.client.get('/issue_book/')
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecommendationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Branch.objects.get(code='MAIN')
+        cls.east = Branch.objects.create(name='East', code='EAST')
+        cls.fiction = Category.objects.create(name='Fiction')
+
+    def add_book(self, title, branch=None, category=None):
+        return Book.objects.create(
+            branch=branch or self.main, title=title, author='Author',
+            ubno=title, category=category or self.fiction,
+        )
+
+    def add_reader(self, name, branch=None):
+        n = Reader.objects.count()
+        return Reader.objects.create(
+            branch=branch or self.main, name=name, phone=f'90000{n:05d}',
+            email=f'{name}@example.com', address='Street',
+        )
+
+    def borrow(self, reader, *books):
+        for book in books:
+            IssueBook.objects.create(branch=book.branch, book=book, reader=reader)
+
+    def recommendations(self, book):
+        return list(
+            BookRecommendation.objects.filter(book=book)
+            .order_by('rank')
+            .values_list('recommended__title', 'score', 'rank')
+        )
+
+    def co_borrowing_catalogue(self):
+        a, b, c, d, e = (self.add_book(t) for t in 'ABCDE')
+        self.borrow(self.add_reader('r1'), a, b, c, d)
+        self.borrow(self.add_reader('r2'), a, b, c)
+        self.borrow(self.add_reader('r3'), a, b)
+        return a, b, c, d, e
+
+    def test_ranks_by_co_borrowing_then_pads_from_category(self):
+        a, *_ = self.co_borrowing_catalogue()
+
+        build_recommendations(top_k=5)
+
+        # E was never borrowed with A, so it only pads; A never pads itself
+        self.assertEqual(
+            self.recommendations(a),
+            [('B', 3, 1), ('C', 2, 2), ('D', 1, 3), ('E', 0, 4)],
+        )
+
+    def test_top_k_cuts_the_list(self):
+        a, *_ = self.co_borrowing_catalogue()
+        build_recommendations(top_k=2)
+        self.assertEqual(self.recommendations(a), [('B', 3, 1), ('C', 2, 2)])
+
+    def test_oversized_baskets_are_skipped(self):
+        a, *_ = self.co_borrowing_catalogue()
+
+        build_recommendations(top_k=5, max_basket=3)
+
+        # r1's four-book basket no longer counts
+        self.assertEqual(
+            self.recommendations(a),
+            [('B', 2, 1), ('C', 1, 2), ('D', 0, 3), ('E', 0, 4)],
+        )
+
+    def test_shards_smaller_than_catalogue_give_same_rows(self):
+        self.co_borrowing_catalogue()
+
+        def snapshot():
+            return sorted(BookRecommendation.objects.values_list(
+                'book_id', 'recommended_id', 'score', 'rank'
+            ))
+
+        build_recommendations(top_k=3)
+        whole = snapshot()
+        build_recommendations(top_k=3, shard_size=2, chunk_size=2)
+
+        self.assertEqual(snapshot(), whole)
+
+    def test_suggestions_dedupe_and_skip_borrowed_in_one_query(self):
+        a, b, c, d, e = self.co_borrowing_catalogue()
+        reader = self.add_reader('asha')
+        self.borrow(reader, a, b)
+        build_recommendations(top_k=5)
+
+        with self.assertNumQueries(1):
+            suggestions = suggestions_for_reader(reader, limit=5)
+
+        # C, D and E neighbour both A and B but are suggested once each
+        self.assertEqual([book.title for book in suggestions], ['C', 'D', 'E'])
+
+    def test_fallback_stays_in_the_books_branch(self):
+        main_books = [self.add_book(f'Main {i}') for i in range(3)]
+        east_books = [self.add_book(f'East {i}', branch=self.east) for i in range(6)]
+        # East titles are far more popular network-wide
+        for i in range(3):
+            self.borrow(self.add_reader(f'east{i}', branch=self.east), *east_books)
+        reader = self.add_reader('asha')
+        self.borrow(reader, main_books[0])
+
+        build_recommendations(top_k=5)
+
+        self.assertEqual(
+            set(suggestions_for_reader(reader, branch=self.main)),
+            set(main_books[1:]),
+        )
+        self.assertFalse(
+            BookRecommendation.objects.filter(
+                book=main_books[0], recommended__branch=self.east
+            ).exists()
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CirculationRollupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('desk', password='pw', is_staff=True)
+        branch = Branch.objects.get(code='MAIN')
+        cls.book = Book.objects.create(
+            branch=branch, title='Dune', author='Herbert', ubno='UB1',
+            category=Category.objects.create(name='Fiction'),
+        )
+        cls.reader = Reader.objects.create(
+            branch=branch, name='Asha', phone='9000000001',
+            email='asha@example.com', address='Street',
+        )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_retier_keeps_rollups_verifiable(self):
+        self.client.post('/issue_book/', {'reader_id': self.reader.library_id, 'book_id': self.book.id})
+        self.client.post(
+            f'/change-membership/{self.reader.library_id}/', {'membership': 'PREMIUM'}
+        )
+        issue = IssueBook.objects.get(reader=self.reader)
+        self.client.post('/return-book/', {'issue_id': issue.id})
+
+        self.assertEqual(issue.membership, 'BASIC')
+        self.assertEqual(diff_rollups(), [])
+
+    def test_report_reads_rollups(self):
+        self.client.post('/issue_book/', {'reader_id': self.reader.library_id, 'book_id': self.book.id})
+        response = self.client.get('/circulation-report/?period=D&by=membership')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['label'], row['loans']) for row in response.context['rows']],
+            [('BASIC', 1)]
+        )
+
+    def test_report_scoped_to_staff_branch(self):
+        main = self.book.branch
+        east = Branch.objects.create(name='East', code='EAST')
+        StaffProfile.objects.create(user=self.staff, branch=main)
+        east_staff = User.objects.create_user('east', password='pw', is_staff=True)
+        StaffProfile.objects.create(user=east_staff, branch=east)
+        east_book = Book.objects.create(
+            branch=east, title='Dune', author='Herbert', ubno='UB1',
+            category=self.book.category,
+        )
+        east_reader = Reader.objects.create(
+            branch=east, name='Ravi', phone='9000000002',
+            email='ravi@example.com', address='Street',
+        )
+
+        self.client.post('/issue_book/', {'reader_id': self.reader.library_id, 'book_id': self.book.id})
+        self.client.force_login(east_staff)
+        self.client.post('/issue_book/', {'reader_id': east_reader.library_id, 'book_id': east_book.id})
+        issue = IssueBook.objects.get(reader=east_reader)
+        self.client.post('/return-book/', {'issue_id': issue.id})
+
+        self.assertEqual(diff_rollups(), [])
+        response = self.client.get('/circulation-report/?period=D')
+        self.assertEqual(
+            [(row['loans'], row['returns']) for row in response.context['rows']], [(1, 1)]
+        )
+        self.client.force_login(self.staff)
+        response = self.client.get('/circulation-report/?period=D')
+        self.assertEqual(
+            [(row['loans'], row['returns']) for row in response.context['rows']], [(1, 0)]
+        )
+
+    def test_migration_rebuilds_rollups_from_loans(self):
+        migration = import_module('library_app.migrations.0014_circulationrollup_branch')
+        self.client.post('/issue_book/', {'reader_id': self.reader.library_id, 'book_id': self.book.id})
+        issue = IssueBook.objects.get(reader=self.reader)
+        self.client.post('/return-book/', {'issue_id': issue.id})
+        CirculationRollup.objects.all().delete()
+
+        migration.rebuild(django_apps, None)
+
+        self.assertEqual(CirculationRollup.objects.count(), 2)
+        self.assertEqual(diff_rollups(), [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BranchScopingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Branch.objects.get(code='MAIN')
+        cls.east = Branch.objects.create(name='East Branch', code='EAST')
+        cls.category = Category.objects.create(name='Fiction')
+
+        cls.main_staff = User.objects.create_user('main-desk', password='pw', is_staff=True)
+        StaffProfile.objects.create(user=cls.main_staff, branch=cls.main)
+        cls.east_staff = User.objects.create_user('east-desk', password='pw', is_staff=True)
+        StaffProfile.objects.create(user=cls.east_staff, branch=cls.east)
+
+        # Data of the other branch, as seen by main-desk
+        cls.east_book = Book.objects.create(
+            branch=cls.east, title='East Book', author='A', ubno='EB1',
+            category=cls.category, total_copies=2, available_copies=2,
+        )
+        cls.east_reader = Reader.objects.create(
+            branch=cls.east, name='East Reader', phone='9100000001',
+            email='east@example.com', address='Street',
+        )
+        cls.east_issue = IssueBook.objects.create(
+            branch=cls.east, book=cls.east_book, reader=cls.east_reader,
+        )
+        cls.main_book = Book.objects.create(
+            branch=cls.main, title='Main Book', author='A', ubno='MB1',
+            category=cls.category, total_copies=2, available_copies=2,
+        )
+        cls.main_reader = Reader.objects.create(
+            branch=cls.main, name='Main Reader', phone='9200000001',
+            email='main@example.com', address='Street',
+        )
+
+    def add_book(self, ubno, title='Dune'):
+        return self.client.post('/add_book/', {
+            'title': title, 'author': 'Herbert', 'ubno': ubno,
+            'category': self.category.id, 'total_copies': 2,
+        })
+
+    def test_moved_staff_branch_survives_generation_eviction(self):
+        cache.clear()
+        request = RequestFactory().get('/')
+        request.user = self.main_staff
+        self.assertEqual(staff_branch(request), self.main)
+
+        profile = self.main_staff.staff_profile
+        profile.branch = self.east
+        profile.save()
+        # Culled or evicted from the shared cache; must not bring back the
+        # entry cached before the move
+        cache.delete(GENERATION_KEY)
+
+        request = RequestFactory().get('/')
+        request.user = self.main_staff
+        self.assertEqual(staff_branch(request), self.east)
+
+    def test_same_ubno_stocked_at_each_branch(self):
+        self.client.force_login(self.main_staff)
+        self.add_book('UB1')
+        self.client.force_login(self.east_staff)
+        self.add_book('UB1')
+        self.add_book('UB1', title='Duplicate')
+
+        self.assertEqual(
+            sorted(Book.objects.filter(ubno='UB1').values_list('branch__code', flat=True)),
+            ['EAST', 'MAIN']
+        )
+
+    def test_login_over_session_without_branch(self):
+        # An admin with no profile has no branch once there are two
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+
+        response = self.client.post('/login/', {'username': 'east-desk', 'password': 'pw'})
+        self.assertRedirects(response, '/staff_page/', fetch_redirect_response=False)
+        self.assertEqual(self.client.get('/staff_page/').context['branch'], self.east)
+
+    def test_issue_book_rejects_other_branch(self):
+        self.client.force_login(self.main_staff)
+        response = self.client.post('/issue_book/', {
+            'reader_id': self.east_reader.library_id, 'book_id': self.main_book.id,
+        })
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/issue_book/', {
+            'reader_id': self.main_reader.library_id, 'book_id': self.east_book.id,
+        })
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(f'/issue_book/?reader_id={self.east_reader.library_id}')
+        self.assertIsNone(response.context['selected_reader'])
+        self.assertEqual(IssueBook.objects.count(), 1)
+
+    def test_return_book_rejects_other_branch(self):
+        self.client.force_login(self.main_staff)
+        response = self.client.post('/return-book/', {'issue_id': self.east_issue.id})
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(f'/return-book/?reader_key={self.east_reader.phone}')
+        self.assertIsNone(response.context['reader'])
+        self.east_issue.refresh_from_db()
+        self.assertFalse(self.east_issue.is_returned)
+
+    def test_change_membership_rejects_other_branch(self):
+        self.client.force_login(self.main_staff)
+        url = f'/change-membership/{self.east_reader.library_id}/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.post(url, {'membership': 'VIP'}).status_code, 404)
+        self.east_reader.refresh_from_db()
+        self.assertEqual(self.east_reader.membership, 'BASIC')
+
+    def test_reader_history_rejects_other_branch(self):
+        self.client.force_login(self.main_staff)
+        response = self.client.get(f'/reader-history/{self.east_reader.library_id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_book_rejects_other_branch(self):
+        self.client.force_login(self.main_staff)
+        response = self.client.get('/view_book/')
+        self.assertEqual(list(response.context['book_data']), [self.main_book])
+
+        response = self.client.post('/view_book/', {
+            'update_book': '1', 'book_id': self.east_book.id, 'title': 'Changed',
+            'author': 'A', 'ubno': 'EB1', 'category': self.category.id, 'total_copies': 2,
+        })
+        self.assertEqual(response.status_code, 404)
+
+        self.client.post('/view_book/', {'delete_book': '1', 'book_id': self.east_book.id})
+        self.east_book.refresh_from_db()
+        self.assertEqual(self.east_book.title, 'East Book')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AdminSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.get(code='MAIN')
+        category = Category.objects.create(name='Fiction')
+        cls.book = Book.objects.create(
+            branch=branch, title='Dune', author='Herbert', ubno='UB-7', category=category,
+        )
+        Book.objects.create(branch=branch, title='Emma', author='Austen', ubno='UB-8', category=category)
+        cls.reader = Reader.objects.create(
+            branch=branch, name='Asha Rao', phone='98765-43210',
+            email='Asha@Example.com', address='Street',
+        )
+        cls.issue = IssueBook.objects.create(branch=branch, book=cls.book, reader=cls.reader)
+
+    def search(self, model, term):
+        qs, _ = admin.site._registry[model].get_search_results(None, model.objects.all(), term)
+        return qs
+
+    def assert_indexed(self, qs):
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertFalse([step for step in plan if step.startswith('SCAN')], plan)
+
+    def test_book_search(self):
+        for term in ('dun', 'UB-7'):
+            qs = self.search(Book, term)
+            self.assertEqual(list(qs), [self.book])
+            self.assert_indexed(qs)
+
+    def test_reader_search(self):
+        for term in ('asha', '098765 43210', 'asha@example.com'):
+            qs = self.search(Reader, term)
+            self.assertEqual(list(qs), [self.reader])
+            self.assert_indexed(qs)
+
+    def test_loan_search(self):
+        for term in ('DUNE', 'asha r', '9876543210'):
+            qs = self.search(IssueBook, term)
+            self.assertEqual(list(qs), [self.issue])
+            self.assert_indexed(qs.order_by())
+
+    def test_non_ascii_reader_search(self):
+        reader = Reader.objects.create(
+            branch=self.reader.branch, name='Élise Ünal', phone='9123456780',
+            email='elise@example.com', address='Street',
+        )
+        for term in ('Élise', 'élise', 'ÉLISE ü', 'élise ünal'):
+            qs = self.search(Reader, term)
+            self.assertEqual(list(qs), [reader], term)
+            self.assert_indexed(qs)
+
+    def test_admin_without_search_q_uses_search_fields(self):
+        class CategoryAdmin(LargeTableAdmin):
+            search_fields = ('name',)
+
+        category = Category.objects.get(name='Fiction')
+        qs, _ = CategoryAdmin(Category, admin.site).get_search_results(
+            None, Category.objects.all(), 'fict'
+        )
+        self.assertEqual(list(qs), [category])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MembershipTierTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        cls.reader = Reader.objects.create(
+            branch=Branch.objects.get(code='MAIN'), name='Asha', phone='9000000001',
+            email='asha@example.com', address='Street',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+        # Reads the tier list into the cache before the new tier exists
+        MembershipTier.limits()
+        MembershipTier.objects.create(code='GOLD', name='Gold', issue_limit=7)
+
+    def test_new_tier_usable_at_desk(self):
+        url = f'/change-membership/{self.reader.library_id}/'
+        self.assertIn(('GOLD', 'Gold'), self.client.get(url).context['tiers'])
+
+        self.client.post(url, {'membership': 'GOLD'})
+        self.reader.refresh_from_db()
+        self.assertEqual((self.reader.membership, self.reader.issue_limit), ('GOLD', 7))
+
+    def test_unknown_tier_rejected_at_desk(self):
+        self.client.post(f'/change-membership/{self.reader.library_id}/', {'membership': 'BOGUS'})
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.membership, 'BASIC')
+
+    def test_admin_form_offers_tier_table(self):
+        request = RequestFactory().get('/')
+        request.user = self.staff
+        form = admin.site._registry[Reader].get_form(request, self.reader)
+        self.assertIn(('GOLD', 'Gold'), list(form.base_fields['membership'].choices))
+
+        self.reader.membership = 'BOGUS'
+        with self.assertRaises(ValidationError):
+            self.reader.full_clean()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RetierTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.get(code='MAIN')
+        cls.basic = [
+            Reader.objects.create(
+                branch=branch, name=f'Basic {i}', phone=f'90000{i:05d}',
+                email=f'basic{i}@example.com', address='Street',
+            )
+            for i in range(7)
+        ]
+        cls.premium = Reader.objects.create(
+            branch=branch, name='Premium', phone='9100000000',
+            email='premium@example.com', address='Street', membership='PREMIUM',
+        )
+        category = Category.objects.create(name='Fiction')
+        # Three open loans and one returned one for the first reader
+        for i in range(4):
+            book = Book.objects.create(
+                branch=branch, title=f'Book {i}', author='Author', ubno=f'UB{i}',
+                category=category,
+            )
+            IssueBook.objects.create(
+                branch=branch, book=book, reader=cls.basic[0], is_returned=i == 3,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def retier_readers(self, *args):
+        out = io.StringIO()
+        call_command('retier_readers', *args, stdout=out)
+        return out.getvalue()
+
+    def tiers(self):
+        return sorted(Reader.objects.values_list('membership', 'issue_limit').distinct())
+
+    def test_pk_chunks_cover_every_row_once(self):
+        pks = sorted(Reader.objects.values_list('pk', flat=True))
+        for chunk_size in (1, 3, 4, 8, 100):
+            bounds = list(_pk_chunks(Reader.objects.all(), chunk_size))
+            covered = [
+                pk for after, upto in bounds for pk in pks
+                if (after is None or pk > after) and pk <= upto
+            ]
+            self.assertEqual(covered, pks, chunk_size)
+            self.assertEqual(len(bounds), -(-len(pks) // chunk_size), chunk_size)
+
+    def test_retier_updates_in_chunks(self):
+        with CaptureQueriesContext(connection) as ctx:
+            changed, _ = retier('VIP', 'BASIC', chunk_size=3)
+
+        self.assertEqual(changed, 7)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(self.tiers(), [('PREMIUM', 5), ('VIP', 10)])
+
+    def test_from_limits_the_readers_moved(self):
+        output = self.retier_readers('--to', 'VIP', '--from', 'PREMIUM', '--chunk-size', '2')
+        self.assertIn("Updated 1 readers to VIP (limit 10)", output)
+        self.assertEqual(self.tiers(), [('BASIC', 3), ('VIP', 10)])
+
+    def test_sync_applies_changed_limit(self):
+        tier = MembershipTier.objects.get(code='BASIC')
+        tier.issue_limit = 4
+        tier.save()
+
+        output = self.retier_readers('--sync', '--chunk-size', '2')
+
+        self.assertIn("Updated 7 readers to BASIC (limit 4)", output)
+        self.assertIn("Updated 0 readers to PREMIUM (limit 5)", output)
+        self.assertEqual(self.tiers(), [('BASIC', 4), ('PREMIUM', 5)])
+
+    def test_dry_run_writes_nothing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            output = self.retier_readers('--to', 'PREMIUM', '--dry-run')
+
+        self.assertIn("Would update 7 readers to PREMIUM (limit 5)", output)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertEqual(self.tiers(), [('BASIC', 3), ('PREMIUM', 5)])
+
+    def test_over_limit_report(self):
+        MembershipTier.objects.create(code='KIDS', name='Kids', issue_limit=2)
+
+        for args in (['--dry-run'], []):
+            output = self.retier_readers('--to', 'KIDS', '--from', 'BASIC', *args)
+            self.assertIn("  1 readers hold more than 2 open loans", output)
+            self.assertIn(f"  {self.basic[0].library_id} Basic 0: 3 open", output)
+
+        self.assertEqual(self.tiers(), [('KIDS', 2), ('PREMIUM', 5)])
+
+
+@override_settings(CACHES=TEST_CACHES, API_KEYS=['test-key'])
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Branch.objects.get(code='MAIN')
+        cls.east = Branch.objects.create(name='East Branch', code='EAST')
+        category = Category.objects.create(name='Fiction')
+        for i in range(5):
+            for branch in (cls.main, cls.east):
+                Book.objects.create(
+                    branch=branch, title=f'{branch.code} {i}', author='A',
+                    ubno=f'UB{i}', category=category,
+                )
+                Reader.objects.create(
+                    branch=branch, name=f'{branch.code} reader {i}',
+                    phone=f'9{branch.id}0000000{i}', email=f'{branch.code}{i}@example.com',
+                    address='Street',
+                )
+
+        cls.staff = User.objects.create_user('east-desk', password='pw', is_staff=True)
+        StaffProfile.objects.create(user=cls.staff, branch=cls.east)
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers=headers)
+
+    def get_keyed(self, url):
+        return self.get(url, **{'X-API-Key': 'test-key'})
+
+    def test_requires_key_or_staff(self):
+        self.assertEqual(self.get('/api/v1/books/').status_code, 401)
+        self.assertEqual(self.get('/api/v1/books/', **{'X-API-Key': 'wrong'}).status_code, 401)
+
+        reader_login = User.objects.create_user('member', password='pw')
+        self.client.force_login(reader_login)
+        self.assertEqual(self.get('/api/v1/books/').status_code, 401)
+
+        self.client.logout()
+        self.assertEqual(self.get_keyed('/api/v1/books/').status_code, 200)
+
+    def test_read_only(self):
+        response = self.client.post('/api/v1/books/', headers={'X-API-Key': 'test-key'})
+        self.assertEqual(response.status_code, 405)
+
+    def test_staff_session_scoped_to_branch(self):
+        self.client.force_login(self.staff)
+        # A ?branch= override is only honoured for API keys
+        data = self.get('/api/v1/books/?branch=MAIN&fields=branch').json()['data']
+        self.assertEqual({row['branch'] for row in data}, {'EAST'})
+        self.assertEqual(len(data), 5)
+
+    def test_key_can_pick_branch(self):
+        data = self.get_keyed('/api/v1/books/?branch=MAIN&fields=branch').json()['data']
+        self.assertEqual({row['branch'] for row in data}, {'MAIN'})
+        self.assertEqual(len(self.get_keyed('/api/v1/books/').json()['data']), 10)
+
+    def test_unknown_branch_is_a_bad_request(self):
+        response = self.get_keyed('/api/v1/books/?branch=NOPE')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unknown branch'})
+        response = self.get('/api/v1/books/?branch=NOPE', **{'X-API-Key': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(API_KEYS=['other-key', 'test-key'])
+    def test_keys_compared_in_constant_time(self):
+        with mock.patch('library_app.api.hmac.compare_digest', wraps=hmac.compare_digest) as compare:
+            self.assertEqual(self.get_keyed('/api/v1/books/').status_code, 200)
+        # Every configured key is compared, not just up to the match
+        self.assertEqual(compare.call_count, 2)
+
+        for key in ('test', 'test-key-2', 'tëst-key'):
+            self.assertEqual(self.get('/api/v1/books/', **{'X-API-Key': key}).status_code, 401)
+
+    def test_reader_contacts_not_exposed(self):
+        row = self.get_keyed('/api/v1/readers/').json()['data'][0]
+        self.assertEqual(set(row), {'id', 'name', 'membership', 'issue_limit', 'branch'})
+        for field in ('phone', 'email', 'address'):
+            response = self.get_keyed(f'/api/v1/readers/?fields={field}')
+            self.assertEqual(response.status_code, 400)
+
+    def walk(self, resource):
+        ids, url = [], f'/api/v1/{resource}/?fields=id&limit=3'
+        while True:
+            body = self.get_keyed(url).json()
+            ids += [row['id'] for row in body['data']]
+            if body['next'] is None:
+                return ids
+            url = f'/api/v1/{resource}/?fields=id&limit=3&after={body["next"]}'
+
+    def test_cursor_walks_every_row_once(self):
+        book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(self.walk('books'), book_ids)
+
+        reader_ids = [
+            str(pk) for pk in Reader.objects.order_by('library_id').values_list('library_id', flat=True)
+        ]
+        self.assertEqual(self.walk('readers'), reader_ids)
+
+    def test_bad_parameters(self):
+        for query in (
+            'limit=abc', 'limit=0', 'after=abc', 'fields=bogus', 'category=x',
+        ):
+            response = self.get_keyed(f'/api/v1/books/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(self.get_keyed('/api/v1/readers/?after=not-a-uuid').status_code, 400)
+        self.assertEqual(self.get_keyed('/api/v1/nothing/').status_code, 404)
+
+
+class BackupTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db = Path(tmp.name) / 'live.sqlite3'
+        conn = sqlite3.connect(self.db)
+        with conn:
+            conn.execute('CREATE TABLE django_migrations (id INTEGER PRIMARY KEY, applied TEXT)')
+            conn.execute("INSERT INTO django_migrations (applied) VALUES ('x')")
+        conn.close()
+
+        self.enterContext(override_settings(BACKUP_DIR=str(Path(tmp.name) / 'backups')))
+        self.enterContext(mock.patch('library_app.backups.database_path', return_value=self.db))
+
+    def rows(self, path=None):
+        conn = sqlite3.connect(path or self.db)
+        try:
+            return conn.execute('SELECT count(*) FROM django_migrations').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_keep_must_leave_the_new_snapshot(self):
+        for keep in ('0', '-1'):
+            with self.assertRaises(CommandError):
+                call_command('backup_db', '--keep', keep, stdout=io.StringIO())
+        self.assertEqual(list_snapshots(), [])
+
+        call_command('backup_db', '--keep', '1', stdout=io.StringIO())
+        [first] = list_snapshots()
+        call_command('backup_db', '--keep', '1', stdout=io.StringIO())
+        [kept] = list_snapshots()
+        self.assertNotEqual(kept, first)
+
+    def test_snapshots_never_overwrite(self):
+        first, _ = create_snapshot()
+        second, _ = create_snapshot()
+        self.assertNotEqual(first, second)
+
+        with mock.patch('library_app.backups.datetime') as clock:
+            clock.now.return_value.strftime.return_value = 'same'
+            create_snapshot()
+            with self.assertRaises(BackupError):
+                create_snapshot()
+        self.assertEqual(len(list_snapshots()), 3)
+
+    def test_restore_keeps_chosen_snapshot(self):
+        snapshot, _ = create_snapshot()
+        conn = sqlite3.connect(self.db)
+        with conn:
+            conn.execute("INSERT INTO django_migrations (applied) VALUES ('y')")
+        conn.close()
+
+        safety = restore_snapshot(snapshot)
+
+        self.assertNotEqual(safety, snapshot)
+        self.assertTrue(snapshot.is_file())
+        self.assertEqual(self.rows(), 1)
+        restore_snapshot(safety, safety=False)
+        self.assertEqual(self.rows(), 2)
+
+    def test_paged_copy_finishes_under_constant_writes(self):
+        conn = sqlite3.connect(self.db)
+        with conn:
+            conn.execute('CREATE TABLE filler (data BLOB)')
+            conn.executemany('INSERT INTO filler VALUES (zeroblob(2000))', [()] * 100)
+        conn.close()
+
+        # Every one-page step is interrupted by a commit, so the copy has
+        # to notice it is not progressing and fall back to a single step
+        with WriteProbe(self.db, interval=0.001):
+            restarts = copy_database(self.db, self.db.with_name('copy.sqlite3'), pages=1, sleep=0.005)
+        self.assertGreater(restarts, 0)
+        self.assertEqual(self.rows(self.db.with_name('copy.sqlite3')), 1)
+
+    def test_write_probe_changes_nothing(self):
+        with WriteProbe(self.db, interval=0.001) as probe:
+            create_snapshot(compress=False)
+            deadline = time.monotonic() + 5
+            while not probe.latencies and time.monotonic() < deadline:
+                time.sleep(0.001)
+        self.assertTrue(probe.latencies)
+
+        conn = sqlite3.connect(self.db)
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        conn.close()
+        self.assertEqual(tables, ['django_migrations'])
+        self.assertEqual(self.rows(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProfilingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('desk', password='pw', is_staff=True)
+
+    def setUp(self):
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(
+            PROFILING_DIR=str(self.dir),
+            PROFILING_ENABLED=False,
+            PROFILING_SAMPLE_RATE=0,
+            PROFILING_SLOW_MS=0,
+            PROFILING_KEEP=200,
+        ))
+        # Forget the flag file state cached by earlier tests
+        set_enabled(False)
+        self.client.force_login(self.staff)
+
+    def captures(self, suffix='.json'):
+        return sorted(self.dir.glob(f'*{suffix}'))
+
+    def test_disabled_is_a_no_op(self):
+        with mock.patch('library_app.profiling.StackSampler') as sampler:
+            self.client.get('/issue_book/')
+        sampler.assert_not_called()
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_slow_request_captured(self):
+        self.client.get('/issue_book/')
+
+        [summary] = self.captures()
+        self.assertTrue(summary.with_suffix('.folded').is_file())
+        capture = json.loads(summary.read_text())
+        self.assertEqual(capture['view'], 'issue_book')
+        self.assertEqual(capture['status'], 200)
+        self.assertGreater(capture['sql']['count'], 0)
+        self.assertEqual(
+            sum(q['count'] for q in capture['sql']['top']), capture['sql']['count']
+        )
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_SLOW_MS=60_000)
+    def test_fast_request_not_captured(self):
+        self.client.get('/issue_book/')
+        self.assertEqual(self.captures(), [])
+
+    @override_settings(PROFILING_ENABLED=True, PROFILING_KEEP=2)
+    def test_captures_pruned_to_keep(self):
+        for _ in range(4):
+            self.client.get('/issue_book/')
+        self.assertEqual(len(self.captures()), 2)
+        self.assertEqual(len(self.captures('.folded')), 2)
+
+    def test_flag_file_toggles_profiling(self):
+        self.assertFalse(is_enabled())
+        call_command('profiling', 'on', stdout=mock.Mock())
+        self.assertTrue((self.dir / 'ENABLED').exists())
+        self.assertTrue(is_enabled())
+
+        self.client.get('/issue_book/')
+        self.assertEqual(len(self.captures()), 1)
+
+        call_command('profiling', 'off', stdout=mock.Mock())
+        self.assertFalse(is_enabled())
+
+    def test_sampler_collapses_stacks(self):
+        sampler = StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        time.sleep(0.05)
+        sampler.stop()
+        self.assertIn(f'{__name__}:test_sampler_collapses_stacks', sampler.collapsed())
+
+    def test_capture_file_rejects_unsafe_ids(self):
+        (self.dir / 'abc.json').write_text('{}')
+        self.assertEqual(capture_file('abc', '.json'), self.dir / 'abc.json')
+        for capture_id in ('', '../abc', 'x/../abc', str(self.dir / 'abc'), 'missing'):
+            self.assertIsNone(capture_file(capture_id, '.json'), capture_id)
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_slow_requests_page_is_staff_only(self):
+        self.client.get('/issue_book/')
+        [summary] = self.captures()
+        capture_id = summary.stem
+
+        response = self.client.get('/slow-requests/')
+        self.assertEqual([c['id'] for c in response.context['captures']], [capture_id])
+        response = self.client.get(f'/slow-requests/{capture_id}/json/')
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['id'], capture_id)
+        response.close()
+        self.assertEqual(self.client.get('/slow-requests/nope/json/').status_code, 404)
+        self.assertEqual(self.client.get(f'/slow-requests/{capture_id}/py/').status_code, 404)
+
+        reader = User.objects.create_user('reader', password='pw')
+        self.client.force_login(reader)
+        for url in ('/slow-requests/', f'/slow-requests/{capture_id}/json/'):
+            response = self.client.get(url)
+            self.assertRedirects(response, '/login/', fetch_redirect_response=False)
+        self.client.logout()
+        response = self.client.get('/slow-requests/')
+        self.assertEqual(response.status_code, 302)
+
+
+class WarmupTests(TestCase):
+
+    def test_warm_templates_fills_cached_loader(self):
+        loader = engines['django'].engine.template_loaders[0]
+        loader.reset()
+        names = warm_templates()
+        self.assertIn('login.html', names)
+        self.assertIn('base.html', names)
+        self.assertEqual(set(names), set(loader.get_template_cache))
+
+    def test_warm_urls_populates_resolver(self):
+        clear_url_caches()
+        warm_urls()
+        self.assertTrue(get_resolver()._populated)
+
+    def test_warm_connection_outlives_request_start(self):
+        warm_connections()
+        # close_old_connections() on request_started drops a connection
+        # whose close_at has passed; with CONN_MAX_AGE = 0 it is "now"
+        self.assertIsNotNone(connection.connection)
+        self.assertGreater(connection.close_at, time.monotonic())
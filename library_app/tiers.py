@@ -0,0 +1,106 @@
+"""
+Bulk membership re-tiering.
+
+Reader.save() applies a tier's issue limit one row at a time. The helpers
+here do the same with set-based UPDATEs over primary-key ranges, one short
+transaction per chunk, so a promotion or a changed limit can be applied to
+millions of readers without looping over save().
+"""
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import MembershipTier, Reader
+
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _readers(from_tier=None, branch=None):
+    readers = Reader.objects.all()
+    if from_tier:
+        readers = readers.filter(membership=from_tier)
+    if branch is not None:
+        readers = readers.filter(branch=branch)
+    return readers
+
+
+def _pk_chunks(queryset, chunk_size):
+    """Yield (after, upto) primary-key bounds covering ``queryset``."""
+    ordered = queryset.order_by('pk').values_list('pk', flat=True)
+    after = None
+
+    while True:
+        page = ordered if after is None else ordered.filter(pk__gt=after)
+        # Only the last key of the chunk is fetched, not the whole chunk
+        upto = page[chunk_size - 1:chunk_size].first()
+        if upto is None:
+            upto = page.last()
+            if upto is None:
+                return
+            yield after, upto
+            return
+        yield after, upto
+        after = upto
+
+
+def over_limit_report(readers, new_limit):
+    """Readers whose open loans exceed ``new_limit``, with their loan count."""
+    return (
+        readers
+        .annotate(open_loans=Count(
+            'issued_books',
+            filter=Q(issued_books__is_returned=False)
+        ))
+        .filter(open_loans__gt=new_limit)
+        .order_by('-open_loans', 'name')
+    )
+
+
+def retier(to_tier, from_tier=None, branch=None, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """Move readers to ``to_tier`` and apply its issue limit.
+
+    With ``from_tier`` only readers on that tier move; passing the same
+    code for both re-applies a changed limit. Returns (changed, over_limit)
+    where over_limit holds the readers with more open loans than the new
+    limit allows (a queryset for ``dry_run``, which writes nothing, and a
+    list captured before the update otherwise).
+    """
+    tier = MembershipTier.objects.get(code=to_tier)
+    # Rows already on the target tier and limit need no write
+    readers = _readers(from_tier, branch).exclude(
+        membership=tier.code,
+        issue_limit=tier.issue_limit
+    )
+    over_limit = over_limit_report(readers, tier.issue_limit)
+
+    if dry_run:
+        return readers.count(), over_limit
+
+    # Evaluate before the update, while the readers still match from_tier
+    over_limit = list(over_limit)
+    updated = 0
+
+    for after, upto in _pk_chunks(readers, chunk_size):
+        chunk = readers.filter(pk__lte=upto)
+        if after is not None:
+            chunk = chunk.filter(pk__gt=after)
+
+        with transaction.atomic():
+            updated += chunk.update(
+                membership=tier.code,
+                issue_limit=tier.issue_limit
+            )
+
+    return updated, over_limit
+
+
+def sync_limits(branch=None, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    """Re-apply every tier's current issue limit to its readers.
+
+    Returns {code: (updated, over_limit)}.
+    """
+    return {
+        code: retier(code, code, branch=branch, chunk_size=chunk_size, dry_run=dry_run)
+        for code in MembershipTier.limits()
+    }
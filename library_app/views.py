@@ -1,16 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse, Http404
 from django.contrib.auth import authenticate, login as auth_login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
 from django.utils import timezone
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from uuid import UUID
 from django.views.decorators.cache import never_cache
 
 
-from .models import Category, Book, Reader, IssueBook
+from .models import (
+    Category, Book, MembershipTier, Reader, IssueBook, CirculationRollup, normalize_phone,
+)
+from .branches import staff_branch
+from .recommendations import suggestions_for_reader
+from .rollups import record_issue, record_return, report_start, trend, trend_totals
+from .profiling import is_enabled as profiling_enabled, list_captures, capture_file
 
 
 # ---------------- HOME ----------------
@@ -21,7 +27,7 @@ def home(request):
 # ---------------- LOGIN ----------------
 def login_view(request):
     # If already logged in, redirect to staff page
-    if request.user.is_authenticated:
+    if request.user.is_authenticated and staff_branch(request):
         return redirect('staff_page')
 
     if request.method == 'POST':
@@ -46,6 +52,11 @@ def login_view(request):
             messages.error(request, "You are not authorised to access staff panel")
             return redirect('login')
 
+        request.user = user
+        if staff_branch(request) is None:
+            messages.error(request, "Your account is not assigned to a branch")
+            return redirect('login')
+
         # ✅ SUCCESS
         auth_login(request, user)
         messages.success(request, f"Welcome {user.username}")
@@ -68,7 +79,12 @@ def staff_logout(request):
 def staff_page(request):
     if not request.user.is_staff:
         return redirect('login')
-    return render(request, 'staff_page.html')
+
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
+    return render(request, 'staff_page.html', {'branch': branch})
 
 
 # ---------------- CATEGORY ----------------
@@ -110,6 +126,10 @@ def add_book(request):
     if not request.user.is_staff:
         return redirect('login')
 
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
     recent_book = None
     categories = Category.objects.all()
 
@@ -120,10 +140,11 @@ def add_book(request):
         category = request.POST.get('category')
         total_copies = int(request.POST.get('total_copies'))
 
-        if Book.objects.filter(ubno=ubno).exists():
+        if Book.objects.filter(branch=branch, ubno=ubno).exists():
             messages.error(request, "Book already exists")
         else:
             recent_book = Book.objects.create(
+                branch=branch,
                 title=title,
                 author=author,
                 ubno=ubno,
@@ -146,11 +167,15 @@ def view_book(request):
     if not request.user.is_staff:
         return redirect('login')
 
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
     if request.method == 'POST' and 'update_book' in request.POST:
-        book = get_object_or_404(Book, id=request.POST.get('book_id'))
+        book = get_object_or_404(Book, id=request.POST.get('book_id'), branch=branch)
         new_ubno = request.POST.get('ubno')
 
-        if Book.objects.exclude(id=book.id).filter(ubno=new_ubno).exists():
+        if Book.objects.exclude(id=book.id).filter(branch=branch, ubno=new_ubno).exists():
             messages.error(request, "Book ID already exists")
             return redirect('view_book')
 
@@ -167,16 +192,16 @@ def view_book(request):
     if request.method == 'POST' and 'delete_book' in request.POST:
         book_id = request.POST.get('book_id')
 
-        if IssueBook.objects.filter(book_id=book_id, is_returned=False).exists():
+        if IssueBook.objects.filter(branch=branch, book_id=book_id, is_returned=False).exists():
             messages.error(request, "Cannot delete book. It is currently issued.")
             return redirect('view_book')
 
-        Book.objects.filter(id=book_id).delete()
+        Book.objects.filter(id=book_id, branch=branch).delete()
         messages.success(request, "Book deleted successfully")
         return redirect('view_book')
 
     return render(request, 'view_book.html', {
-        'book_data': Book.objects.all(),
+        'book_data': Book.objects.filter(branch=branch),
         'categories': Category.objects.all()
     })
 
@@ -188,27 +213,36 @@ def add_reader(request):
     if not request.user.is_staff:
         return redirect('login')
 
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
     if request.method == 'POST':
         name = request.POST.get('reader_name')
         phone = request.POST.get('number')
         email = request.POST.get('email')
         address = request.POST.get('address')
 
-        if Reader.objects.filter(phone=phone).exists():
-            messages.error(request, "Phone number already exists")
-            return redirect('add_reader')
-
-        if Reader.objects.filter(email=email).exists():
-            messages.error(request, "Email already exists")
+        # Single insert; the unique normalized phone/email indexes reject
+        # duplicates, also under concurrent desks
+        try:
+            with transaction.atomic():
+                Reader.objects.create(
+                    branch=branch,
+                    name=name,
+                    phone=phone,
+                    email=email,
+                    address=address
+                )
+        except IntegrityError as e:
+            if 'phone_normalized' in str(e):
+                messages.error(request, "Phone number already exists")
+            elif 'email_normalized' in str(e):
+                messages.error(request, "Email already exists")
+            else:
+                raise
             return redirect('add_reader')
 
-        Reader.objects.create(
-            name=name,
-            phone=phone,
-            email=email,
-            address=address
-        )
-
         messages.success(request, f"Reader '{name}' added successfully")
         return redirect('add_reader')
 
@@ -219,8 +253,12 @@ def add_reader(request):
 @login_required(login_url='/login/')
 @never_cache
 def view_reader(request):
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
     query = request.GET.get('q')
-    readers = Reader.objects.all()
+    readers = Reader.objects.filter(branch=branch)
 
     if query:
         readers = readers.filter(
@@ -242,10 +280,15 @@ def issue_book(request):
     if not request.user.is_staff:
         return redirect('login')
 
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
     reader = None
     readers = []
     books = []
     issued_books = []
+    suggestions = []
 
     reader_q = request.GET.get('reader_q')
     book_q = request.GET.get('book_q')
@@ -255,29 +298,35 @@ def issue_book(request):
         readers = Reader.objects.filter(
             Q(name__icontains=reader_q) |
             Q(phone__icontains=reader_q) |
-            Q(email__icontains=reader_q)
+            Q(email__icontains=reader_q),
+            branch=branch
         )
 
     if reader_id:
-        reader = Reader.objects.filter(library_id=reader_id).first()
+        reader = Reader.objects.filter(library_id=reader_id, branch=branch).first()
         if reader:
             issued_books = IssueBook.objects.filter(
+                branch=branch,
                 reader=reader,
                 is_returned=False
             )
+            suggestions = suggestions_for_reader(
+                reader, available_only=True, branch=branch
+            )
 
     if book_q:
         books = Book.objects.filter(
             Q(title__icontains=book_q) |
             Q(ubno__icontains=book_q),
+            branch=branch,
             available_copies__gt=0
         )
 
     if request.method == 'POST':
-        reader = get_object_or_404(Reader, library_id=request.POST.get('reader_id'))
-        book = get_object_or_404(Book, id=request.POST.get('book_id'))
+        reader = get_object_or_404(Reader, library_id=request.POST.get('reader_id'), branch=branch)
+        book = get_object_or_404(Book, id=request.POST.get('book_id'), branch=branch)
 
-        if IssueBook.objects.filter(reader=reader, is_returned=False).count() >= reader.issue_limit:
+        if IssueBook.objects.filter(branch=branch, reader=reader, is_returned=False).count() >= reader.issue_limit:
             messages.error(request, "Issue limit reached")
             return redirect(f"{request.path}?reader_id={reader.library_id}")
 
@@ -290,9 +339,10 @@ def issue_book(request):
             return redirect(f"{request.path}?reader_id={reader.library_id}")
 
         with transaction.atomic():
-            IssueBook.objects.create(reader=reader, book=book)
+            issue = IssueBook.objects.create(branch=branch, reader=reader, book=book)
             book.available_copies -= 1
             book.save()
+            record_issue(issue)
 
         messages.success(request, "Book issued successfully")
         return redirect(f"{request.path}?reader_id={reader.library_id}")
@@ -303,7 +353,8 @@ def issue_book(request):
         'readers': readers,
         'books': books,
         'selected_reader': reader,
-        'issued_books': issued_books
+        'issued_books': issued_books,
+        'suggestions': suggestions
     })
 
 
@@ -314,26 +365,43 @@ def change_membership(request, reader_id):
     if not request.user.is_staff:
         return redirect('login')
 
-    reader = get_object_or_404(Reader, library_id=reader_id)
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
+    reader = get_object_or_404(Reader, library_id=reader_id, branch=branch)
 
     if request.method == 'POST':
-        reader.membership = request.POST.get('membership')
+        membership = request.POST.get('membership')
+        if membership not in MembershipTier.limits():
+            messages.error(request, "Unknown membership plan")
+            return redirect('change_membership', reader_id=reader.library_id)
+
+        reader.membership = membership
         reader.save()
         messages.success(request, "Membership updated successfully")
         return redirect('view_reader')
 
-    return render(request, 'change_membership.html', {'reader': reader})
+    return render(request, 'change_membership.html', {
+        'reader': reader,
+        'tiers': MembershipTier.choices()
+    })
 
 
 # ---------------- AJAX READER SEARCH ----------------
 @login_required(login_url='/login/')
 @never_cache
 def reader_search(request):
+    branch = staff_branch(request)
+    if branch is None:
+        return JsonResponse([], safe=False)
+
     q = request.GET.get('q', '')
     readers = Reader.objects.filter(
         Q(name__icontains=q) |
         Q(phone__icontains=q) |
-        Q(email__icontains=q)
+        Q(email__icontains=q),
+        branch=branch
     )[:10]
 
     return JsonResponse([
@@ -349,6 +417,10 @@ def return_book(request):
     if not request.user.is_staff:
         return redirect('login')
 
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
     reader = None
     issued_books = []
     reader_key = request.GET.get('reader_key')
@@ -356,12 +428,16 @@ def return_book(request):
     if reader_key:
         try:
             UUID(reader_key)
-            reader = Reader.objects.filter(library_id=reader_key).first()
+            reader = Reader.objects.filter(library_id=reader_key, branch=branch).first()
         except ValueError:
-            reader = Reader.objects.filter(phone=reader_key).first()
+            reader = Reader.objects.filter(
+                phone_normalized=normalize_phone(reader_key),
+                branch=branch
+            ).first()
 
         if reader:
             issued_books = IssueBook.objects.filter(
+                branch=branch,
                 reader=reader,
                 is_returned=False
             )
@@ -370,8 +446,9 @@ def return_book(request):
 
     if request.method == 'POST':
         issue = get_object_or_404(
-            IssueBook,
+            IssueBook.objects.select_related('book', 'reader'),
             id=request.POST.get('issue_id'),
+            branch=branch,
             is_returned=False
         )
 
@@ -383,6 +460,7 @@ def return_book(request):
             book = issue.book
             book.available_copies += 1
             book.save()
+            record_return(issue)
 
         messages.success(request, "Book returned successfully")
         return redirect('return_book')
@@ -400,15 +478,21 @@ def reader_history(request, reader_id):
     if not request.user.is_staff:
         return redirect('login')
 
-    reader = get_object_or_404(Reader, library_id=reader_id)
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
+    reader = get_object_or_404(Reader, library_id=reader_id, branch=branch)
 
     issues = IssueBook.objects.filter(
+        branch=branch,
         reader=reader
     ).select_related('book').order_by('-issue_date')
 
     return render(request, 'reader_history.html', {
         'reader': reader,
-        'issues': issues
+        'issues': issues,
+        'suggestions': suggestions_for_reader(reader, branch=branch)
     })
 
 #----------------- ACTIVE READERS ----------------
@@ -418,7 +502,12 @@ def active_readers(request):
     if not request.user.is_staff:
         return redirect('login')
 
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
     readers = Reader.objects.filter(
+        branch=branch,
         issued_books__is_returned=False
     ).distinct()
 
@@ -431,3 +520,65 @@ def active_readers(request):
     return render(request, 'active_readers.html', {
         'readers': readers
     })
+
+#----------------- CIRCULATION REPORT ----------------
+@login_required(login_url='/login/')
+@never_cache
+def circulation_report(request):
+    if not request.user.is_staff:
+        return redirect('login')
+
+    branch = staff_branch(request)
+    if branch is None:
+        return redirect('login')
+
+    period = request.GET.get('period')
+    if period not in (CirculationRollup.DAILY, CirculationRollup.MONTHLY):
+        period = CirculationRollup.MONTHLY
+    by = 'membership' if request.GET.get('by') == 'membership' else 'category'
+
+    # Reads the pre-aggregated rollups only, never IssueBook
+    rows = list(trend(
+        period, start=report_start(period, timezone.localdate()), by=by, branch=branch
+    ))
+
+    return render(request, 'circulation_report.html', {
+        'branch': branch,
+        'period': period,
+        'by': by,
+        'rows': rows,
+        'totals': trend_totals(rows)
+    })
+
+#----------------- SLOW REQUESTS ----------------
+@login_required(login_url='/login/')
+@never_cache
+def slow_requests(request):
+    if not request.user.is_staff:
+        return redirect('login')
+
+    return render(request, 'slow_requests.html', {
+        'captures': list_captures(),
+        'profiling_enabled': profiling_enabled()
+    })
+
+
+@login_required(login_url='/login/')
+@never_cache
+def profile_capture(request, capture_id, kind):
+    if not request.user.is_staff:
+        return redirect('login')
+
+    if kind not in ('folded', 'json'):
+        raise Http404("Capture not found")
+
+    path = capture_file(capture_id, f'.{kind}')
+    if path is None:
+        raise Http404("Capture not found")
+
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=path.name,
+        content_type='text/plain' if kind == 'folded' else 'application/json'
+    )
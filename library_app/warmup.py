@@ -0,0 +1,49 @@
+"""
+Warm-up steps for app servers, used by gunicorn.conf.py.
+
+warm_master() runs once in the gunicorn master when the app is preloaded;
+anything it compiles is shared with every forked worker. warm_worker()
+runs in each worker after fork and opens its database connection, which
+CONN_MAX_AGE keeps open for the worker's first request.
+"""
+
+from pathlib import Path
+
+from django.apps import apps
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+
+def warm_templates():
+    """Compile every template of this app into the cached template loader."""
+    template_dir = Path(apps.get_app_config('library_app').path) / 'templates'
+    names = sorted(
+        str(path.relative_to(template_dir))
+        for path in template_dir.rglob('*.html')
+    )
+    for name in names:
+        get_template(name)
+    return names
+
+
+def warm_urls():
+    # Compiles the URL patterns, otherwise done by the first request
+    get_resolver().url_patterns
+    get_resolver().reverse_dict
+
+
+def warm_connections():
+    for conn in connections.all():
+        conn.ensure_connection()
+
+
+def warm_master():
+    warm_templates()
+    warm_urls()
+    # Connections must not be shared with forked workers
+    connections.close_all()
+
+
+def warm_worker():
+    warm_connections()
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files on Render
+    'library_app.profiling.ProfilingMiddleware',  # No-op unless profiling is on
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,9 +78,50 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep each worker's connection across requests, so the one opened
+        # in post_worker_init serves the first request; the health check
+        # replaces a connection that went bad while idle
+        'CONN_MAX_AGE': int(os.environ.get("CONN_MAX_AGE", "600")),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# ==============================
+# CACHE, SESSIONS & MESSAGES
+# ==============================
+
+# File-based so every gunicorn worker on the host shares sessions and
+# cached users; point CACHE_DIR at fast local storage. Past MAX_ENTRIES
+# (default 300) a third of the entries are culled at random; each write
+# lists the directory, so size it to the sessions and users it holds.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get("CACHE_DIR", os.path.join(BASE_DIR, 'cache')),
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get("CACHE_MAX_ENTRIES", "20000")),
+        },
+    }
+}
+
+# cached_db reads sessions from the cache and only falls back to the
+# django_session table on a miss; 'django.contrib.sessions.backends.signed_cookies'
+# avoids the table entirely
+SESSION_ENGINE = os.environ.get(
+    "SESSION_ENGINE", "django.contrib.sessions.backends.cached_db"
+)
+
+# Flash messages live in a cookie and never touch the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# The cached backend keeps the logged-in user in the cache between
+# requests; ModelBackend stays listed so existing sessions remain valid
+AUTHENTICATION_BACKENDS = [
+    'library_app.auth_backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # ==============================
 # PASSWORD VALIDATION
 # ==============================
@@ -122,3 +164,32 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 # ==============================
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# ==============================
+# BACKUPS
+# ==============================
+
+# Compressed snapshots written by `manage.py backup_db`
+BACKUP_DIR = os.environ.get("BACKUP_DIR", os.path.join(BASE_DIR, 'backups'))
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+
+# ==============================
+# JSON API
+# ==============================
+
+# Keys accepted in the X-API-Key header of /api/v1/ (comma separated)
+API_KEYS = [k for k in os.environ.get("API_KEYS", "").split(",") if k]
+
+# ==============================
+# REQUEST PROFILING
+# ==============================
+
+# Can also be toggled at runtime with `manage.py profiling on|off`
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "False") == "True"
+PROFILING_DIR = os.environ.get("PROFILING_DIR", os.path.join(BASE_DIR, 'profiles'))
+# Fraction of requests captured regardless of latency
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0.01"))
+# Requests slower than this are always captured
+PROFILING_SLOW_MS = float(os.environ.get("PROFILING_SLOW_MS", "500"))
+PROFILING_INTERVAL_MS = float(os.environ.get("PROFILING_INTERVAL_MS", "5"))
+PROFILING_KEEP = int(os.environ.get("PROFILING_KEEP", "200"))
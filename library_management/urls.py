@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path
-from library_app import views
+from library_app import views, api
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -31,6 +31,12 @@ urlpatterns = [
 
     path('reader-history/<uuid:reader_id>/', views.reader_history, name='reader_history'),
     path('active-readers/', views.active_readers, name='active_readers'),
+    path('circulation-report/', views.circulation_report, name='circulation_report'),
+
+    path('slow-requests/', views.slow_requests, name='slow_requests'),
+    path('slow-requests/<str:capture_id>/<str:kind>/', views.profile_capture, name='profile_capture'),
+
+    path('api/v1/<str:resource>/', api.resource_list, name='api_resource_list'),
 
 ]
 if settings.DEBUG: